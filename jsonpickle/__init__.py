@@ -55,17 +55,17 @@ added to JSON::
 """
 from jsonpickle import pickler
 from jsonpickle import unpickler
-from jsonpickle.backend import JSONBackend
+from jsonpickle.backend import JSONBackend  # noqa: F401 (re-exported)
+from jsonpickle.backend import json
 from jsonpickle.version import VERSION
 
 # ensure built-in handlers are loaded
 __import__('jsonpickle.handlers')
 
-__all__ = ('encode', 'decode')
+__all__ = ('encode', 'iterencode', 'decode', 'dump', 'load',
+           'dump_lines', 'iter_load_lines')
 __version__ = VERSION
 
-json = JSONBackend()
-
 # Export specific JSONPluginMgr methods into the jsonpickle namespace
 set_preferred_backend = json.set_preferred_backend
 set_encoder_options = json.set_encoder_options
@@ -81,7 +81,10 @@ def encode(value,
            max_depth=None,
            backend=None,
            warn=False,
-           max_iter=None):
+           max_iter=None,
+           iterative=False,
+           key_order='sorted',
+           cycle_check='seen'):
     """Return a JSON formatted representation of value, a Python object.
 
     :param unpicklable: If set to False then the output will not contain the
@@ -103,6 +106,24 @@ def encode(value,
         (e.g. file descriptors).
     :param max_iter: If set to a non-negative integer then jsonpickle will
         consume at most `max_iter` items when pickling iterators.
+    :param iterative: If set to True then jsonpickle walks nested lists,
+        dicts and plain objects using an explicit stack instead of recursing,
+        so deeply nested objects do not exhaust Python's recursion limit.
+        The output is identical to the default recursive walk.
+    :param key_order: The order in which the items of dicts and objects are
+        written.  'sorted', the default, sorts the items of each dict by key
+        once.  'insertion' keeps the order of each dict, which skips sorting
+        altogether, and overrides a `sort_keys` encoder option.  Before
+        Python 3.7, whose dicts have no insertion order, it sorts like
+        'sorted'.  'canonical' sorts like 'sorted' and also has the
+        backend sort the keys of every JSON object, including the py/ tags,
+        so that equal objects produce identical documents.
+    :param cycle_check: Which objects are replaced by their repr() when
+        make_refs is False.  'seen', the default, replaces every list and
+        object that has already been written, including objects that are
+        merely shared.  'ancestors' only replaces the objects that contain
+        themselves, so shared objects are written out in full each time and
+        no record of the objects written so far is kept.
 
     >>> encode('my string')
     '"my string"'
@@ -128,16 +149,102 @@ def encode(value,
                           make_refs=make_refs,
                           keys=keys,
                           max_depth=max_depth,
-                          warn=warn)
+                          warn=warn,
+                          iterative=iterative,
+                          key_order=key_order,
+                          cycle_check=cycle_check)
+
+
+def iterencode(value,
+               unpicklable=True,
+               make_refs=True,
+               keys=False,
+               max_depth=None,
+               backend=None,
+               warn=False,
+               max_iter=None,
+               key_order='sorted',
+               cycle_check='seen'):
+    """Encode value like encode(), yielding the JSON text in chunks.
+
+    The graph is written out while it is walked, so the whole document is
+    never held in memory at once.  The chunks can be written to any
+    file-like object::
+
+        with open('snapshot.json', 'w') as fp:
+            for chunk in jsonpickle.iterencode(obj):
+                fp.write(chunk)
 
+    The keyword arguments are the same as for encode().
 
-def decode(string, backend=None, keys=False):
+    >>> ''.join(iterencode({'foo': [1, 2]}))
+    '{"foo": [1, 2]}'
+
+    """
+    if backend is None:
+        backend = json
+    return pickler.iterencode(value,
+                              backend=backend,
+                              unpicklable=unpicklable,
+                              make_refs=make_refs,
+                              keys=keys,
+                              max_depth=max_depth,
+                              warn=warn,
+                              max_iter=max_iter,
+                              key_order=key_order,
+                              cycle_check=cycle_check)
+
+
+def decode(string, backend=None, keys=False, iterative=False,
+           single_pass=False, in_place=False, class_cache=None,
+           classes=None, import_classes=True, sort_keys=False):
     """Convert a JSON string into a Python object.
 
     The keyword argument 'keys' defaults to False.
     If set to True then jsonpickle will decode non-string dictionary keys
     into python objects via the jsonpickle protocol.
 
+    The keyword argument 'iterative' defaults to False.
+    If set to True then jsonpickle restores nested lists, dicts and objects
+    using an explicit stack instead of recursing, so deeply nested data
+    does not exhaust Python's recursion limit.
+
+    The keyword argument 'single_pass' defaults to False.
+    If set to True then objects are restored by the json or simplejson
+    backend's parser as soon as they have been parsed, instead of walking
+    the parsed document a second time.  Custom handlers then receive data
+    whose nested objects have already been restored.  Documents that
+    contain references, and decoding with `keys=True`, fall back to the
+    default two-pass decoding.
+
+    The keyword argument 'in_place' defaults to False.
+    If set to True then the lists and dicts produced by the JSON backend
+    are reused by the restored object, and only the entries that need to
+    be restored are replaced, instead of copying every container.
+
+    The keyword argument 'class_cache' defaults to None.
+    A `jsonpickle.unpickler.ClassCache` can be passed to share the classes
+    that have been looked up by name across calls to decode().
+
+    The keyword argument 'classes' defaults to None.
+    It can be a dict that maps names such as 'mymodule.Thing' to classes,
+    or a class or sequence of classes and functions that are known by
+    their importable names.  These names are resolved with a dictionary
+    lookup, without importing anything.
+
+    The keyword argument 'import_classes' defaults to True.
+    If set to False then names that are not in 'classes' are not imported,
+    and the objects that refer to them are left as plain dicts, as are the
+    'py/repr' values that would otherwise be imported and evaluated.
+
+    The keyword argument 'sort_keys' defaults to False.
+    The items of each JSON object are restored in the order of the document,
+    which is the order they were encoded in.  If set to True then they are
+    restored sorted by key instead, which is only needed for documents that
+    went through a JSON library that does not preserve the order of keys.
+    Before Python 3.7, whose dicts do not keep the order of the document,
+    the items are always sorted.
+
     >>> str(decode('"my string"'))
     'my string'
     >>> decode('36')
@@ -145,7 +252,158 @@ def decode(string, backend=None, keys=False):
     """
     if backend is None:
         backend = json
-    return unpickler.decode(string, backend=backend, keys=keys)
+    return unpickler.decode(string, backend=backend, keys=keys,
+                            iterative=iterative, single_pass=single_pass,
+                            in_place=in_place, class_cache=class_cache,
+                            classes=classes, import_classes=import_classes,
+                            sort_keys=sort_keys)
+
+
+def dump(value, fp,
+         unpicklable=True,
+         make_refs=True,
+         keys=False,
+         max_depth=None,
+         backend=None,
+         warn=False,
+         max_iter=None,
+         key_order='sorted',
+         cycle_check='seen'):
+    """Encode value like encode() and write the JSON text to a file.
+
+    `fp` is any object with a write() method.  The text is written in the
+    chunks produced by iterencode(), so with the json and simplejson
+    backends the whole document is never held in memory at once.  Other
+    backends encode the document in one go, which is written as a single
+    chunk.  When encoding fails, e.g. on a cycle that references cannot
+    break, the text written until then is left in `fp`::
+
+        with open('snapshot.json', 'w') as fp:
+            jsonpickle.dump(obj, fp)
+
+    The keyword arguments are the same as for encode().
+
+    """
+    write = fp.write
+    for chunk in iterencode(value,
+                            unpicklable=unpicklable,
+                            make_refs=make_refs,
+                            keys=keys,
+                            max_depth=max_depth,
+                            backend=backend,
+                            warn=warn,
+                            max_iter=max_iter,
+                            key_order=key_order,
+                            cycle_check=cycle_check):
+        write(chunk)
+
+
+def load(fp, backend=None, keys=False, iterative=False,
+         single_pass=False, in_place=False, class_cache=None,
+         classes=None, import_classes=True, sort_keys=False):
+    """Read the JSON text in a file and convert it into a Python object.
+
+    `fp` is any object with a read() method::
+
+        with open('snapshot.json') as fp:
+            obj = jsonpickle.load(fp)
+
+    The text is read in one go and decoded without being copied again.
+    The keyword arguments are the same as for decode().
+
+    """
+    return decode(fp.read(), backend=backend, keys=keys,
+                  iterative=iterative, single_pass=single_pass,
+                  in_place=in_place, class_cache=class_cache,
+                  classes=classes, import_classes=import_classes,
+                  sort_keys=sort_keys)
+
+
+# The number of lines that dump_lines() joins for each write
+_LINES_PER_WRITE = 1024
+
+
+def dump_lines(values, fp,
+               unpicklable=True,
+               make_refs=True,
+               keys=False,
+               max_depth=None,
+               backend=None,
+               warn=False,
+               max_iter=None,
+               key_order='sorted',
+               cycle_check='seen'):
+    """Encode each of the values like encode() and write them as JSON Lines.
+
+    Each value is written to `fp` on a line of its own.  One pickler is
+    used for all of the values and its references are reset between them,
+    so every line can be decoded on its own::
+
+        with open('records.jsonl', 'w') as fp:
+            jsonpickle.dump_lines(records, fp)
+
+    The lines are written in batches.  The keyword arguments are the same
+    as for encode(), and the backend must not be configured to add
+    newlines to its output, e.g. with an `indent` option.
+
+    """
+    if backend is None:
+        backend = json
+    context = pickler.Pickler(unpicklable=unpicklable,
+                              make_refs=make_refs,
+                              keys=keys,
+                              backend=backend,
+                              max_depth=max_depth,
+                              warn=warn,
+                              max_iter=max_iter,
+                              key_order=key_order,
+                              cycle_check=cycle_check)
+    encode = pickler.encode
+    write = fp.write
+    lines = []
+    for value in values:
+        lines.append(encode(value, backend=backend, context=context))
+        if len(lines) == _LINES_PER_WRITE:
+            lines.append('')
+            write('\n'.join(lines))
+            del lines[:]
+    if lines:
+        lines.append('')
+        write('\n'.join(lines))
+
+
+def iter_load_lines(fp, backend=None, keys=False, iterative=False,
+                    single_pass=False, in_place=False, class_cache=None,
+                    classes=None, import_classes=True, sort_keys=False):
+    """Decode each line of a JSON Lines file, yielding the Python objects.
+
+    This reads the files written by dump_lines().  The lines are read one
+    at a time and decoded by a single unpickler, which is reset between
+    them, and blank lines are skipped::
+
+        with open('records.jsonl') as fp:
+            for record in jsonpickle.iter_load_lines(fp):
+                ...
+
+    The keyword arguments are the same as for decode().
+
+    """
+    if backend is None:
+        backend = json
+    context = unpickler.Unpickler(backend=backend,
+                                  keys=keys,
+                                  iterative=iterative,
+                                  in_place=in_place,
+                                  class_cache=class_cache,
+                                  classes=classes,
+                                  import_classes=import_classes,
+                                  sort_keys=sort_keys)
+    decode = unpickler.decode
+    for line in fp:
+        if not line or line.isspace():
+            continue
+        yield decode(line, backend=backend, context=context,
+                     single_pass=single_pass)
 
 
 # json.load(),loads(), dump(), dumps() compatibility
@@ -1,9 +1,16 @@
 # -*- coding: utf-8 -*-
 
+import sys
+import threading
+
 from jsonpickle.compat import PY32
 from jsonpickle.compat import unicode
 
 
+# The backends whose encoders accept a sort_keys option
+_SORT_KEYS_BACKENDS = ('json', 'simplejson', 'django.util.simplejson', 'ujson')
+
+
 class JSONBackend(object):
     """Manages encoding and decoding using various backends.
 
@@ -39,18 +46,53 @@ class JSONBackend(object):
         # Whether we've loaded any backends successfully
         self._verified = False
 
+        # Maps the names of backends that have not been imported yet
+        # to the arguments for _load()
+        self._lazy = {}
+        # Serializes the imports done by _import()
+        self._lock = threading.Lock()
+
+        # The backends are imported when they are first used
         if not PY32:
-            self.load_backend('simplejson')
-        self.load_backend('json')
-        self.load_backend('demjson', 'encode', 'decode', 'JSONDecodeError')
-        self.load_backend('jsonlib', 'write', 'read', 'ReadError')
-        self.load_backend('yajl')
-        self.load_backend('ujson')
+            self._register('simplejson')
+        self._register('json')
+        self._register('demjson', 'encode', 'decode', 'JSONDecodeError')
+        self._register('jsonlib', 'write', 'read', 'ReadError')
+        self._register('yajl')
+        self._register('ujson')
+
+    def _register(self, name,
+                  dumps='dumps', loads='loads', loads_exc=ValueError):
+        """Add a backend that is imported by _import() on first use"""
+        self._lazy[name] = (dumps, loads, loads_exc)
+        self._encoder_options[name] = ([], {})
+        self._backend_names.append(name)
+
+    def _import(self, name):
+        """Import a registered backend
+
+        Returns False after removing the backend if it cannot be loaded.
+        The backend stays in _lazy until it has been loaded, so that other
+        threads wait for the import instead of using a half-loaded backend.
+
+        """
+        if name not in self._lazy:
+            return name in self._encoders
+        with self._lock:
+            args = self._lazy.get(name)
+            if args is None:
+                # Another thread imported the backend in the meantime
+                return name in self._encoders
+            loaded = self._load(name, *args)
+            self._lazy.pop(name, None)
+            return loaded
 
     def _verify(self):
         """Ensures that we've loaded at least one JSON backend."""
-        if self._verified:
-            return
+        # Skip the preferred backends that are not installed
+        for name in list(self._backend_names):
+            if self._import(name):
+                return
         raise AssertionError('jsonpickle requires at least one of the '
                              'following:\n'
                              '    python2.6, simplejson, or demjson')
@@ -95,10 +137,29 @@ class JSONBackend(object):
         :rtype bool: True on success, False if the backend could not be loaded.
 
         """
+        # Do not import a backend with the same name later
+        self._lazy.pop(name, None)
+        if not self._load(name, dumps, loads, loads_exc):
+            return False
+
+        # Setup the default args and kwargs for this encoder
+        self._encoder_options[name] = ([], {})
+
+        # Add this backend to the list of candidate backends
+        if name not in self._backend_names:
+            self._backend_names.append(name)
+
+        # Indicate that we successfully loaded a JSON backend
+        self._verified = True
+        return True
+
+    def _load(self, name, dumps, loads, loads_exc):
+        """Import a backend and store its functions and exception class"""
         try:
             # Load the JSON backend
             mod = __import__(name)
         except ImportError:
+            self.remove_backend(name)
             return False
 
         # Handle submodules, e.g. django.utils.simplejson
@@ -106,6 +167,7 @@ class JSONBackend(object):
             for attr in name.split('.')[1:]:
                 mod = getattr(mod, attr)
         except AttributeError:
+            self.remove_backend(name)
             return False
 
         if (not self._store(self._encoders, name, mod, dumps) or
@@ -119,19 +181,11 @@ class JSONBackend(object):
         else:
             # simplejson uses ValueError
             self._decoder_exceptions[name] = loads_exc
-
-        # Setup the default args and kwargs for this encoder
-        self._encoder_options[name] = ([], {})
-
-        # Add this backend to the list of candidate backends
-        self._backend_names.append(name)
-
-        # Indicate that we successfully loaded a JSON backend
-        self._verified = True
         return True
 
     def remove_backend(self, name):
         """Remove all entries for a particular backend."""
+        self._lazy.pop(name, None)
         self._encoders.pop(name, None)
         self._decoders.pop(name, None)
         self._decoder_exceptions.pop(name, None)
@@ -140,38 +194,89 @@ class JSONBackend(object):
             self._backend_names.remove(name)
         self._verified = bool(self._backend_names)
 
-    def encode(self, obj):
+    def encode(self, obj, sort_keys=None):
         """
         Attempt to encode an object into JSON.
 
         This tries the loaded backends in order and passes along the last
         exception if no backend is able to encode the object.
 
+        When `sort_keys` is True or False the backends that support it are
+        told whether to sort the keys of every JSON object, overriding their
+        encoder options.  None leaves it to the encoder options.
+
         """
         self._verify()
 
         if not self._fallthrough:
             name = self._backend_names[0]
-            return self.backend_encode(name, obj)
+            return self.backend_encode(name, obj, sort_keys=sort_keys)
 
-        for idx, name in enumerate(self._backend_names):
+        error = None
+        for name in list(self._backend_names):
+            if not self._import(name):
+                continue
             try:
-                optargs, optkwargs = self._encoder_options[name]
-                encoder_kwargs = optkwargs.copy()
-                encoder_args = (obj,) + tuple(optargs)
-                return self._encoders[name](*encoder_args, **encoder_kwargs)
+                return self.backend_encode(name, obj, sort_keys=sort_keys)
             except Exception as e:
-                if idx == len(self._backend_names) - 1:
-                    raise e
+                error = e
+        raise error
     # def dumps
     dumps = encode
 
-    def backend_encode(self, name, obj):
+    def backend_encode(self, name, obj, sort_keys=None):
         optargs, optkwargs = self._encoder_options[name]
         encoder_kwargs = optkwargs.copy()
+        if sort_keys is not None and name in _SORT_KEYS_BACKENDS:
+            encoder_kwargs['sort_keys'] = sort_keys
         encoder_args = (obj,) + tuple(optargs)
         return self._encoders[name](*encoder_args, **encoder_kwargs)
 
+    def can_sort_keys(self):
+        """Return True if the preferred backend's encoder can sort keys"""
+        self._verify()
+        return self._backend_names[0] in _SORT_KEYS_BACKENDS
+
+    def json_encoder(self, sort_keys=None):
+        """
+        Return a JSONEncoder configured like the preferred backend's encoder
+
+        Pickler.iterencode() uses the encoder to write JSON incrementally.
+        None is returned when the preferred backend is not json or
+        simplejson, or when a custom encoder class has been configured,
+        in which case the document has to be encoded in one go.
+        `sort_keys` overrides the encoder options like it does for encode().
+
+        """
+        self._verify()
+        name = self._backend_names[0]
+        if name not in ('json', 'simplejson'):
+            return None
+        optargs, optkwargs = self._encoder_options[name]
+        if 'cls' in optkwargs or optkwargs.get('item_sort_key'):
+            return None
+        if sort_keys is not None:
+            optkwargs = dict(optkwargs, sort_keys=sort_keys)
+        return sys.modules[name].JSONEncoder(*optargs, **optkwargs)
+
+    def json_decoder(self, object_pairs_hook):
+        """
+        Return a JSONDecoder that passes every JSON object to a hook
+
+        The preferred backend's decoder calls `object_pairs_hook` with the
+        (key, value) pairs of each JSON object as soon as the object has
+        been parsed, and uses the hook's return value in its place.
+        None is returned when the preferred backend is not json or
+        simplejson.
+
+        """
+        self._verify()
+        name = self._backend_names[0]
+        if name not in ('json', 'simplejson'):
+            return None
+        return sys.modules[name].JSONDecoder(
+            object_pairs_hook=object_pairs_hook)
+
     def decode(self, string):
         """
         Attempt to decode an object from a JSON string.
@@ -186,14 +291,16 @@ class JSONBackend(object):
             name = self._backend_names[0]
             return self.backend_decode(name, string)
 
-        for idx, name in enumerate(self._backend_names):
+        error = None
+        for name in list(self._backend_names):
+            if not self._import(name):
+                continue
             try:
                 return self.backend_decode(name, string)
             except self._decoder_exceptions[name] as e:
-                if idx == len(self._backend_names) - 1:
-                    raise e
-                else:
-                    pass  # and try a more forgiving encoder, e.g. demjson
+                # try a more forgiving encoder, e.g. demjson
+                error = e
+        raise error
     # def loads
     loads = decode
 
@@ -218,7 +325,7 @@ class JSONBackend(object):
         AssertionError is raised if the backend has not been loaded.
 
         """
-        if name in self._backend_names:
+        if name in self._backend_names and self._import(name):
             self._backend_names.remove(name)
             self._backend_names.insert(0, name)
         else:
@@ -251,3 +358,7 @@ class JSONBackend(object):
             self.remove_backend(backend)
             return False
         return True
+
+
+# The backend that is shared by everything that is not given a backend
+json = JSONBackend()
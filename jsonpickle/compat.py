@@ -7,6 +7,9 @@ PY_MINOR = sys.version_info[1]
 PY2 = PY_MAJOR == 2
 PY3 = PY_MAJOR == 3
 PY32 = PY3 and PY_MINOR == 2
+# Whether dicts, and so the objects parsed by the JSON backends, keep
+# the order in which their items were inserted
+ORDERED_DICTS = sys.version_info >= (3, 7)
 
 try:
     bytes = bytes
@@ -35,12 +38,21 @@ except NameError:
     unichr = chr
 
 
-try:
-    # Python3
-    import queue
-except ImportError:
-    # Python2
-    import Queue as queue
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        # queue imports threading, so it is only imported when it is used
+        if name == 'queue':
+            import queue
+            return queue
+        raise AttributeError('module %r has no attribute %r' %
+                             (__name__, name))
+else:
+    try:
+        # Python3
+        import queue
+    except ImportError:
+        # Python2
+        import Queue as queue
 
 
 __all__ = ['bytes', 'set', 'unicode', 'long', 'unichr', 'queue']
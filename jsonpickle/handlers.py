@@ -22,17 +22,12 @@ objects that implement the reduce protocol::
 
 """
 
-import collections
-import copy
-import datetime
-import decimal
-import re
 import sys
-import time
+import threading
 
 from jsonpickle import util
 from jsonpickle.compat import unicode
-from jsonpickle.compat import queue
+from jsonpickle.compat import PY3
 
 
 class Registry(object):
@@ -40,22 +35,64 @@ class Registry(object):
     def __init__(self):
         self._handlers = {}
         self._base_handlers = {}
+        # Maps types to the handler resolved for them, or None
+        self._resolved = {}
+        # Incremented whenever the handlers change, so that a handler
+        # resolved concurrently with a change is not cached
+        self._generation = 0
+        self._lock = threading.Lock()
+        # Lookup tables derived from the registered handlers
+        self._caches = []
 
     def get(self, cls_or_name, default=None):
         """
         :param cls_or_name: the type or its fully qualified name
         :param default: default value, if a matching handler is not found
 
-        Looks up a handler by type reference or its fully qualified name. If a direct match
-        is not found, the search is performed over all handlers registered with base=True.
+        Looks up a handler by type reference or its fully qualified name.
+        For a type without a direct match, the handler registered for its
+        fully qualified name is used, and then the handler registered with
+        base=True for the nearest class in its MRO.  The handler resolved for
+        each type is cached until a handler is registered or unregistered.
         """
-        handler = self._handlers.get(cls_or_name)
-        if handler is None and util.is_type(cls_or_name):  # attempt to find a base class
-            for cls, base_handler in self._base_handlers.items():
-                if issubclass(cls_or_name, cls):
-                    return base_handler
+        try:
+            handler = self._resolved[cls_or_name]
+        except KeyError:
+            handler = self._resolve(cls_or_name)
         return default if handler is None else handler
 
+    def _resolve(self, cls_or_name):
+        generation = self._generation
+        handler = self._handlers.get(cls_or_name)
+        if not util.is_type(cls_or_name):
+            # names are looked up directly and are not cached
+            return handler
+        cls = cls_or_name
+        if handler is None:
+            handler = self._handlers.get(util.importable_name(cls))
+        if handler is None and self._base_handlers:
+            handler = self._resolve_base(cls)
+        self.store(self._resolved, cls, handler, generation)
+        return handler
+
+    def _resolve_base(self, cls):
+        """Return the base handler registered nearest to `cls` in its MRO"""
+        try:
+            mro = cls.__mro__
+        except AttributeError:
+            # there is no __mro__ for old-style classes
+            import inspect
+            mro = inspect.getmro(cls)
+        for base in mro:
+            handler = self._base_handlers.get(base)
+            if handler is not None:
+                return handler
+        # virtual subclasses of abstract base classes are not in the MRO
+        for base, handler in list(self._base_handlers.items()):
+            if issubclass(cls, base):
+                return handler
+        return None
+
     def register(self, cls, handler=None, base=False):
         """Register the a custom handler for a class
 
@@ -78,15 +115,74 @@ class Registry(object):
             raise TypeError('{0!r} is not a class/type'.format(cls))
         # store both the name and the actual type for the ugly cases like
         # _sre.SRE_Pattern that cannot be loaded back directly
-        self._handlers[util.importable_name(cls)] = self._handlers[cls] = handler
-        if base:
-            # only store the actual type for subclass checking
-            self._base_handlers[cls] = handler
+        with self._lock:
+            self._handlers[util.importable_name(cls)] = handler
+            self._handlers[cls] = handler
+            if base:
+                # only store the actual type for subclass checking
+                self._base_handlers[cls] = handler
+        self.clear_caches()
+
+    def register_name(self, name, handler):
+        """Register a custom handler for the class with a qualified name
+
+        :param name: The fully qualified name of the class, as returned by
+            :func:`jsonpickle.util.importable_name`
+        :param handler: The custom handler class
+
+        The class is not imported, so handlers for classes from modules that
+        are expensive to import cost nothing until such a class is pickled
+        or unpickled.  The pickler and unpickler look up handlers by name
+        when a class is not registered directly.
+
+        """
+        with self._lock:
+            self._handlers[name] = handler
+        self.clear_caches()
 
     def unregister(self, cls):
-        self._handlers.pop(cls, None)
-        self._handlers.pop(util.importable_name(cls), None)
-        self._base_handlers.pop(cls, None)
+        with self._lock:
+            self._handlers.pop(cls, None)
+            self._handlers.pop(util.importable_name(cls), None)
+            self._base_handlers.pop(cls, None)
+        self.clear_caches()
+
+    def add_cache(self, cache):
+        """Register a dict that must be cleared whenever a handler changes
+
+        The pickler and unpickler keep per-type lookup tables that depend
+        on the registered handlers.  Registering those tables here keeps
+        them consistent with :func:`register` and :func:`unregister`,
+        and lets :meth:`clear_caches` release the types that they hold.
+
+        """
+        self._caches.append(cache)
+        return cache
+
+    @property
+    def generation(self):
+        """The number of times the registered handlers have changed"""
+        return self._generation
+
+    def store(self, cache, key, value, generation):
+        """Store `value` in `cache` unless a handler changed since `generation`
+
+        Values computed while :func:`register` or :func:`unregister` run
+        concurrently could describe the old handlers, so they are dropped
+        instead of outliving the cache being cleared.
+
+        """
+        with self._lock:
+            if generation == self._generation:
+                cache[key] = value
+
+    def clear_caches(self):
+        """Empty every cache registered with :meth:`add_cache`"""
+        with self._lock:
+            self._generation += 1
+            self._resolved.clear()
+        for cache in self._caches:
+            cache.clear()
 
 
 registry = Registry()
@@ -172,9 +268,11 @@ class DatetimeHandler(BaseHandler):
         return cls.__new__(cls, *params)
 
 
-DatetimeHandler.handles(datetime.datetime)
-DatetimeHandler.handles(datetime.date)
-DatetimeHandler.handles(datetime.time)
+# The built-in handlers are registered by name so that importing jsonpickle
+# does not import the modules that define the classes they handle.
+registry.register_name('datetime.datetime', DatetimeHandler)
+registry.register_name('datetime.date', DatetimeHandler)
+registry.register_name('datetime.time', DatetimeHandler)
 
 
 class RegexHandler(BaseHandler):
@@ -185,9 +283,13 @@ class RegexHandler(BaseHandler):
         return data
 
     def restore(self, data):
+        import re
         return re.compile(data['pattern'])
 
-RegexHandler.handles(type(re.compile('')))
+if sys.version_info >= (3, 7):
+    registry.register_name('re.Pattern', RegexHandler)
+else:
+    registry.register_name('_sre.SRE_Pattern', RegexHandler)
 
 
 class SimpleReduceHandler(BaseHandler):
@@ -230,23 +332,25 @@ class OrderedDictReduceHandler(SimpleReduceHandler):
         return data
 
 
-SimpleReduceHandler.handles(time.struct_time)
-SimpleReduceHandler.handles(datetime.timedelta)
+registry.register_name('time.struct_time', SimpleReduceHandler)
+registry.register_name('datetime.timedelta', SimpleReduceHandler)
 if sys.version_info >= (2, 7):
-    SimpleReduceHandler.handles(collections.Counter)
+    registry.register_name('collections.Counter', SimpleReduceHandler)
     if sys.version_info >= (3, 4):
-        OrderedDictReduceHandler.handles(collections.OrderedDict)
+        registry.register_name('collections.OrderedDict',
+                               OrderedDictReduceHandler)
     else:
-        SimpleReduceHandler.handles(collections.OrderedDict)
+        registry.register_name('collections.OrderedDict',
+                               SimpleReduceHandler)
 
-if sys.version_info >= (3, 0):
-    SimpleReduceHandler.handles(decimal.Decimal)
+if PY3:
+    registry.register_name('decimal.Decimal', SimpleReduceHandler)
 
-try:
-    import posix
-    SimpleReduceHandler.handles(posix.stat_result)
-except ImportError:
-    pass
+if 'posix' in sys.builtin_module_names:
+    if PY3:
+        registry.register_name('os.stat_result', SimpleReduceHandler)
+    else:
+        registry.register_name('posix.stat_result', SimpleReduceHandler)
 
 
 class QueueHandler(BaseHandler):
@@ -260,9 +364,13 @@ class QueueHandler(BaseHandler):
         return data
 
     def restore(self, data):
+        from jsonpickle.compat import queue
         return queue.Queue()
 
-QueueHandler.handles(queue.Queue)
+if PY3:
+    registry.register_name('queue.Queue', QueueHandler)
+else:
+    registry.register_name('Queue.Queue', QueueHandler)
 
 
 class CloneFactory(object):
@@ -271,8 +379,11 @@ class CloneFactory(object):
     def __init__(self, exemplar):
         self.exemplar = exemplar
 
-    def __call__(self, clone=copy.copy):
+    def __call__(self, clone=None):
         """Create new instances by making copies of the provided exemplar"""
+        if clone is None:
+            import copy
+            clone = copy.copy
         return clone(self.exemplar)
 
     def __repr__(self):
@@ -9,14 +9,15 @@
 
 import warnings
 import sys
+import types
 from itertools import chain, islice
 
 import jsonpickle.util as util
 import jsonpickle.tags as tags
 import jsonpickle.handlers as handlers
 
-from jsonpickle.backend import JSONBackend
-from jsonpickle.compat import unicode, PY3, PY2
+from jsonpickle.backend import json as default_backend
+from jsonpickle.compat import unicode, PY3, PY2, ORDERED_DICTS
 
 
 def encode(value,
@@ -28,7 +29,10 @@ def encode(value,
            backend=None,
            warn=False,
            context=None,
-           max_iter=None):
+           max_iter=None,
+           iterative=False,
+           key_order='sorted',
+           cycle_check='seen'):
     backend = _make_backend(backend)
     if context is None:
         context = Pickler(unpicklable=unpicklable,
@@ -37,17 +41,67 @@ def encode(value,
                           backend=backend,
                           max_depth=max_depth,
                           warn=warn,
-                          max_iter=max_iter)
-    return backend.encode(context.flatten(value, reset=reset))
+                          max_iter=max_iter,
+                          iterative=iterative,
+                          key_order=key_order,
+                          cycle_check=cycle_check)
+    if (not context.unpicklable and context._max_depth is None and
+            (not context._sort_keys or backend.can_sort_keys()) and
+            (ORDERED_DICTS or context._backend_sort_keys) and
+            _is_plain(value, context.keys)):
+        # The document flattens to itself, so there is nothing to do
+        # besides having the backend sort the keys like flatten() would
+        return backend.encode(value, sort_keys=context._sort_keys)
+    data = context.flatten(value, reset=reset)
+    return backend.encode(data, sort_keys=context._backend_sort_keys)
+
+
+def iterencode(value,
+               unpicklable=False,
+               make_refs=True,
+               keys=False,
+               max_depth=None,
+               reset=True,
+               backend=None,
+               warn=False,
+               context=None,
+               max_iter=None,
+               key_order='sorted',
+               cycle_check='seen'):
+    """Encode `value` like encode(), yielding the JSON text in chunks"""
+    backend = _make_backend(backend)
+    if context is None:
+        context = Pickler(unpicklable=unpicklable,
+                          make_refs=make_refs,
+                          keys=keys,
+                          backend=backend,
+                          max_depth=max_depth,
+                          warn=warn,
+                          max_iter=max_iter,
+                          key_order=key_order,
+                          cycle_check=cycle_check)
+    return context.iterencode(value, reset=reset)
 
 
 def _make_backend(backend):
     if backend is None:
-        return JSONBackend()
+        return default_backend
     else:
         return backend
 
 
+# The orders that Pickler(key_order=...) can write dict items in:
+# 'insertion' keeps the order of each dict, 'sorted' sorts the items of
+# each dict by key once, and 'canonical' also has the backend sort the keys
+# of every JSON object, including the py/ tags, for a canonical document.
+KEY_ORDERS = ('insertion', 'sorted', 'canonical')
+
+# The objects that Pickler(make_refs=False, cycle_check=...) writes as their
+# repr(): 'seen' repeats every list and object that has been flattened
+# before, and 'ancestors' only the objects that contain themselves.
+CYCLE_CHECKS = ('seen', 'ancestors')
+
+
 class Pickler(object):
 
     def __init__(self,
@@ -57,7 +111,16 @@ class Pickler(object):
                  backend=None,
                  keys=False,
                  warn=False,
-                 max_iter=None):
+                 max_iter=None,
+                 iterative=False,
+                 key_order='sorted',
+                 cycle_check='seen'):
+        if key_order not in KEY_ORDERS:
+            raise ValueError('key_order must be one of %s, not %r' %
+                             (', '.join(KEY_ORDERS), key_order))
+        if cycle_check not in CYCLE_CHECKS:
+            raise ValueError('cycle_check must be one of %s, not %r' %
+                             (', '.join(CYCLE_CHECKS), cycle_check))
         self.unpicklable = unpicklable
         self.make_refs = make_refs
         self.backend = _make_backend(backend)
@@ -69,15 +132,53 @@ class Pickler(object):
         self._max_depth = max_depth
         # Maps id(obj) to reference IDs
         self._objs = {}
-        # Avoids garbage collection
+        # Keeps the objects in _objs alive so that their ids are not reused
         self._seen = []
         # maximum amount of items to take from a pickled iterator
         self._max_iter = max_iter
+        # Walk containers with an explicit stack instead of recursing
+        self.iterative = iterative
+        # The order in which the items of dicts are flattened
+        self.key_order = key_order
+        # Dicts that do not keep their order have no insertion order
+        self._sort_keys = key_order != 'insertion' or not ORDERED_DICTS
+        # Whether the backend sorts the keys of every JSON object, or None
+        # to leave it to the encoder options.  In insertion order the keys
+        # must not be sorted, since the references are numbered in the
+        # order that the items are flattened in.  Dicts that do not keep
+        # their order are written in the order of the dict, as before.
+        if key_order == 'canonical':
+            self._backend_sort_keys = True
+        elif key_order == 'insertion':
+            self._backend_sort_keys = False
+        else:
+            self._backend_sort_keys = None
+        # Whether _flatten() uses the engine for one-way documents
+        self._json_only = False
+        # How make_refs=False finds the objects that it writes as repr()
+        self.cycle_check = cycle_check
+        # Whether only the ancestors of an object are checked, in which case
+        # no ids are recorded in _objs
+        self._cut_cycles = not make_refs and cycle_check == 'ancestors'
+        # ids of the objects that are currently being flattened
+        self._ancestors = set()
 
     def reset(self):
         self._objs = {}
         self._depth = -1
         self._seen = []
+        self._ancestors = set()
+
+    def _use_json_engine(self):
+        """Return True if the output needs no reference bookkeeping
+
+        Documents that are not unpicklable never contain references, so
+        unless make_refs=False or max_depth turn repeated or deep objects
+        into their repr(), they are flattened by _flatten_json().
+
+        """
+        return (not self.unpicklable and self.make_refs and
+                self._max_depth is None and not self.iterative)
 
     def _push(self):
         """Steps down one level in the namespace.
@@ -94,10 +195,13 @@ class Pickler(object):
         return value
 
     def _mkref(self, obj):
+        if self._cut_cycles:
+            return True
         objid = id(obj)
         if objid not in self._objs:
             new_id = len(self._objs)
             self._objs[objid] = new_id
+            self._seen.append(obj)
             return True
         # Do not use references if not unpicklable.
         if not self.unpicklable or not self.make_refs:
@@ -108,6 +212,28 @@ class Pickler(object):
     def _getref(self, obj):
         return {tags.ID: self._objs.get(id(obj))}
 
+    def _is_repeat(self, obj):
+        """Return True if make_refs=False writes `obj` as its repr()"""
+        if self._cut_cycles:
+            return id(obj) in self._ancestors
+        return id(obj) in self._objs
+
+    def _flatten_on_path(self, obj, func, *args):
+        """Return func(*args), which flattens the children of `obj`
+
+        With cycle_check='ancestors' the children are flattened while `obj`
+        is one of the ancestors, so that references back to it are cut.
+
+        """
+        if not self._cut_cycles:
+            return func(*args)
+        objid = id(obj)
+        self._ancestors.add(objid)
+        try:
+            return func(*args)
+        finally:
+            self._ancestors.discard(objid)
+
     def flatten(self, obj, reset=True):
         """Takes an object and returns a JSON-safe representation of it.
 
@@ -138,71 +264,554 @@ class Pickler(object):
         """
         if reset:
             self.reset()
+        self._json_only = self._use_json_engine()
         return self._flatten(obj)
 
+    def iterencode(self, obj, reset=True):
+        """Encode `obj` into JSON, yielding the text as it is produced
+
+        The chunks add up to the same text as encode(), but lists, tuples,
+        sets, dicts and plain objects are written out while they are walked
+        instead of being flattened into an intermediate tree first, so
+        memory use is bounded by the nesting depth of the graph rather than
+        by the size of the document.
+
+        Dicts whose keys the encoder could reorder or merge are flattened
+        before they are written, as is the whole document when the
+        preferred backend is not json or simplejson.
+
+        """
+        if reset:
+            self.reset()
+        self._json_only = self._use_json_engine()
+        sort_keys = self._backend_sort_keys
+        encoder = self.backend.json_encoder(sort_keys=sort_keys)
+        if encoder is None:
+            yield self.backend.encode(self._flatten(obj), sort_keys=sort_keys)
+            return
+
+        frames = self._frames()
+        try:
+            for chunk in self._write_frames(obj, _JSONWriter(encoder), frames):
+                yield chunk
+        finally:
+            frames.abandon()
+
+    def _write_frames(self, obj, writer, frames):
+        """Flatten `obj` with `frames`, yielding its JSON text in chunks"""
+        # The output state of each frame: [level, count, pending, tag].
+        # `level` is the indentation level of the frame's container,
+        # `count` is the number of items that have been written into it,
+        # `pending` holds the items that were in the frame's dict before
+        # its children were flattened, and `tag` is the py/tuple or py/set
+        # tag of a list that is wrapped in a dict.
+        outs = []
+        chunks = []
+        write = chunks.append
+
+        value = self._flatten_step(obj, True, frames)
+        if value is _PENDING and not self._stream_frame(frames, outs, 0,
+                                                        writer):
+            value = self._flatten_frames(frames, value)
+        if value is not _PENDING:
+            write(writer.value(value, 0))
+
+        while frames:
+            frame = frames[-1]
+            out = outs[-1]
+            kind, items, level = frame[0], frame[2], out[0]
+
+            # Write children until one of them needs a frame of its own
+            value = _PENDING
+            if kind == _LIST:
+                child_level = level + 1
+                for v in items:
+                    if len(chunks) > _CHUNK_SIZE:
+                        yield ''.join(chunks)
+                        del chunks[:]
+                    writer.begin_item(write, out, '[')
+                    value = self._flatten_step(v, True, frames)
+                    if value is _PENDING:
+                        if self._stream_frame(frames, outs, child_level,
+                                              writer):
+                            break
+                        value = self._flatten_frames(frames, value,
+                                                     len(frames) - 1)
+                    write(writer.value(value, child_level))
+            elif kind == _DICT:
+                child_level = level + 1
+                for k, v in items:
+                    if not util.is_picklable(k, v):
+                        continue
+                    if len(chunks) > _CHUNK_SIZE:
+                        yield ''.join(chunks)
+                        del chunks[:]
+                    writer.begin_key(write, out, k)
+                    value = self._flatten_step(v, True, frames)
+                    if value is _PENDING:
+                        if self._stream_frame(frames, outs, child_level,
+                                              writer):
+                            break
+                        value = self._flatten_frames(frames, value,
+                                                     len(frames) - 1)
+                    write(writer.value(value, child_level))
+            else:
+                # The state is written as the py/state item of the
+                # object's dict, or in place of the dict
+                if self.unpicklable:
+                    child_level = level + 1
+                else:
+                    child_level = level
+                for v in items:
+                    if self.unpicklable:
+                        writer.begin_key(write, out, tags.STATE)
+                    value = self._flatten_step(v, False, frames)
+                    if value is _PENDING:
+                        if self._stream_frame(frames, outs, child_level,
+                                              writer):
+                            break
+                        value = self._flatten_frames(frames, value,
+                                                     len(frames) - 1)
+                    write(writer.value(value, child_level))
+            if value is _PENDING and frames[-1] is not frame:
+                continue
+
+            # All of the children are done so the frame is complete
+            frames.finish()
+            outs.pop()
+            if kind == _LIST:
+                writer.end(write, out, '[', ']')
+                if out[3] is not None:
+                    write(writer.newline(level - 1) + '}')
+            elif kind == _DICT or self.unpicklable:
+                writer.end(write, out, '{', '}')
+            if frame[4]:
+                self._pop(None)
+
+        if chunks:
+            yield ''.join(chunks)
+
+    def _stream_frame(self, frames, outs, level, writer):
+        """Prepare to write the frame that has just been pushed
+
+        Returns False, leaving the frame to _flatten_frames(), when the
+        encoder could write the frame's dict in a different order than it
+        is flattened in, or merge some of its keys.
+
+        """
+        frame = frames[-1]
+        kind, data = frame[0], frame[1]
+        tag = frame[5]
+        if kind == _DICT or (kind == _STATE and self.unpicklable):
+            if not ORDERED_DICTS and not writer.sort_keys:
+                # The encoder writes the keys in the order of the dict
+                return False
+        if kind == _DICT:
+            if writer.sort_keys and not self._sort_keys:
+                # The encoder writes the keys in a different order
+                return False
+            items = list(frame[2])
+            frame[2] = iter(items)
+            for k, v in items:
+                if (k in data or not isinstance(k, (str, unicode)) or
+                        self.keys and k.startswith(tags.JSON_KEY)):
+                    return False
+        if kind == _LIST and tag is not None:
+            # py/tuple and py/set lists are wrapped in a dict
+            level += 1
+        # The pending items are popped from the end of the list
+        if kind == _LIST:
+            pending = []
+        elif writer.sort_keys:
+            pending = sorted(data.items(), key=util.itemgetter, reverse=True)
+        else:
+            pending = list(data.items())
+            pending.reverse()
+        outs.append([level, 0, pending, tag])
+        return True
+
     def _flatten(self, obj):
+        if self._json_only:
+            return self._flatten_json(obj)
+        if self.iterative:
+            return self._flatten_iteratively(obj)
         self._push()
         return self._pop(self._flatten_obj(obj))
 
-    def _flatten_obj(self, obj):
-        self._seen.append(obj)
-        max_reached = self._depth == self._max_depth
+    def _flatten_json(self, obj):
+        """Flatten `obj` into a document that is not meant to be unpickled
+
+        This produces the same output as the default engine does with
+        unpicklable=False, but skips the depth and reference bookkeeping
+        whose results such documents do not use.  Only the objects that
+        are currently being flattened are tracked, so that a cycle raises
+        a ValueError instead of exhausting the stack.
+
+        """
+        cls = type(obj)
+        if cls in _PLAIN_TYPES:
+            return obj
+        try:
+            flatten_func = _flatteners[cls]
+        except KeyError:
+            flatten_func = _get_flattener(cls)
+        if flatten_func == _flatten_primitive:
+            return obj
+        if not (flatten_func == _flatten_list or
+                flatten_func == _flatten_dict_obj or
+                flatten_func == _ref_obj_instance or
+                flatten_func == _flatten_tuple or
+                flatten_func == _flatten_set):
+            return flatten_func(self, obj)
+
+        objid = id(obj)
+        ancestors = self._ancestors
+        if objid in ancestors:
+            raise ValueError('Circular reference detected')
+        ancestors.add(objid)
+        try:
+            if flatten_func == _flatten_dict_obj:
+                value = self._flatten_plain_dict(obj)
+                if value is None:
+                    value = self._flatten_json_items(obj, {})
+            elif flatten_func == _ref_obj_instance:
+                value = self._flatten_json_instance(obj)
+            elif _PLAIN_TYPES.issuperset(map(type, obj)):
+                value = list(obj)
+            else:
+                flatten_json = self._flatten_json
+                value = [flatten_json(v) for v in obj]
+        finally:
+            ancestors.discard(objid)
+        return value
+
+    def _flatten_json_items(self, obj, data):
+        """Flatten the items of the dict `obj` into `data` for _flatten_json()"""
+        flatten_json = self._flatten_json
+        keys = self.keys
+        for k, v in self._items(obj):
+            if k in tags.RESERVED:
+                continue
+            if (type(v) not in _NON_FUNCTION_TYPES and
+                    not util.is_picklable(k, v)):
+                continue
+            if keys or type(k) not in _PLAIN_KEY_TYPES:
+                k = self._flatten_key(k)
+            data[k] = flatten_json(v)
+        return data
+
+    def _flatten_json_instance(self, obj):
+        """Flatten an instance of a user class for _flatten_json()"""
+        plan = _get_plan(obj)
+        if not plan.is_plain:
+            return self._flatten_obj_instance(obj)
+        if plan.has_getstate:
+            try:
+                state = obj.__getstate__()
+            except TypeError:
+                # Has getstate but it cannot be called, e.g. file descriptors
+                # in Python3
+                self._pickle_warning(obj)
+                return None
+            return self._flatten_json(state)
+        if not plan.has_dict or util.is_iterator(obj):
+            return self._flatten_obj_instance(obj)
+        # hack for zope persistent objects; this unghostifies the object
+        getattr(obj, '_', None)
+        attrs = obj.__dict__
+        if type(attrs) is not dict:
+            return self._flatten_dict_obj(attrs, {})
+        return self._flatten_json_items(attrs, {})
+
+    def _flatten_iteratively(self, obj):
+        """Flatten `obj` using an explicit stack of partially built containers
+
+        This produces exactly the same output as the recursive _flatten(),
+        including the py/id numbering, but nesting lists, tuples, sets,
+        dicts and plain objects does not consume Python stack frames,
+        so arbitrarily deep graphs can be flattened.
+
+        Each frame is a list of
+        [kind, data, items, key, pop, tag, objid, ref, added]:
+        the container being built, an iterator over the children that
+        remain to be flattened, the key of the child being flattened,
+        whether the depth must be popped once the frame completes,
+        the py/tuple or py/set tag that wraps a finished list, the
+        id() of the object that the frame flattens, whether that object
+        becomes a reference when it is met again, and whether the frame
+        added the id to the ancestors.
+
+        Objects with custom handlers or pickle protocol methods are
+        handed to _flatten_obj_instance(), which flattens their children
+        by re-entering this method.
+
+        Cycles that are not broken by references, which exhaust the stack
+        when flattening recursively, raise a ValueError instead.
+
+        """
+        frames = self._frames()
+        try:
+            value = self._flatten_step(obj, True, frames)
+            return self._flatten_frames(frames, value)
+        finally:
+            frames.abandon()
 
-        if max_reached or (not self.make_refs and id(obj) in self._objs):
+    def _frames(self):
+        """Return an empty stack of frames for the iterative engine"""
+        return _Frames(self._ancestors,
+                       self.unpicklable or not self.make_refs)
+
+    def _flatten_frames(self, frames, value, stop=0):
+        """Complete the topmost frames until only `stop` frames remain
+
+        `value` is the value of the child that was flattened last, or
+        _PENDING when the topmost frame has just been pushed.  The value
+        of the last completed frame is returned.
+
+        """
+        while len(frames) > stop:
+            frame = frames[-1]
+            kind, data, items = frame[0], frame[1], frame[2]
+
+            # Store the value of the child that has just been completed
+            if value is not _PENDING:
+                if kind == _LIST:
+                    data.append(value)
+                elif kind == _DICT:
+                    data[frame[3]] = value
+                else:
+                    frame[3] = value
+
+            # Flatten children until one of them needs a frame of its own
+            value = _PENDING
+            if kind == _LIST:
+                for v in items:
+                    value = self._flatten_step(v, True, frames)
+                    if value is _PENDING:
+                        break
+                    data.append(value)
+            elif kind == _DICT:
+                for k, v in items:
+                    if not util.is_picklable(k, v):
+                        continue
+                    frame[3] = k = self._flatten_key(k)
+                    value = self._flatten_step(v, True, frames)
+                    if value is _PENDING:
+                        break
+                    data[k] = value
+            else:
+                # __getstate__() values are flattened at the object's depth
+                for v in items:
+                    value = self._flatten_step(v, False, frames)
+                    if value is _PENDING:
+                        break
+                    frame[3] = value
+            if value is _PENDING and frames[-1] is not frame:
+                continue
+
+            # All of the children are done so the frame is complete
+            frames.finish()
+            if kind == _LIST:
+                if frame[5] is not None:
+                    data = {frame[5]: data}
+            elif kind == _STATE:
+                if self.unpicklable:
+                    data[tags.STATE] = frame[3]
+                else:
+                    data = frame[3]
+            if frame[4]:
+                data = self._pop(data)
+            value = data
+
+        return value
+
+    def _flatten_step(self, obj, push, frames):
+        """Flatten `obj`, or push a frame for it and return _PENDING
+
+        This is the iterative counterpart of _flatten() when `push` is
+        True, and of _flatten_obj() otherwise.
+
+        """
+        if push:
+            self._push()
+
+        if (self._depth == self._max_depth or
+                (not self.make_refs and self._is_repeat(obj))):
             # break the cycle
-            flatten_func = repr
+            value = repr(obj)
         else:
-            flatten_func = self._get_flattener(obj)
+            try:
+                flatten_func = _flatteners[type(obj)]
+            except KeyError:
+                flatten_func = _get_flattener(type(obj))
+
+            if flatten_func == _flatten_primitive:
+                value = obj
+            elif flatten_func == _flatten_list:
+                if not self._mkref(obj):
+                    self._push()
+                    value = self._getref(obj)
+                elif self._is_plain_list(obj):
+                    value = obj[:]
+                else:
+                    frames.push(_LIST, [], iter(obj), push, None, obj, True)
+                    return _PENDING
+            elif flatten_func == _flatten_dict_obj:
+                value = self._flatten_plain_dict(obj)
+                if value is None:
+                    items = iter(self._items(obj))
+                    frames.push(_DICT, {}, items, push, None, obj, False)
+                    return _PENDING
+            elif flatten_func == _ref_obj_instance:
+                if self._mkref(obj):
+                    value = self._flatten_obj_instance_step(obj, push, frames)
+                    if value is _PENDING:
+                        return value
+                else:
+                    value = self._getref(obj)
+            elif (flatten_func == _flatten_tuple or
+                    flatten_func == _flatten_set):
+                if self._is_plain_list(obj):
+                    value = flatten_func(self, obj)
+                else:
+                    if not self.unpicklable:
+                        tag = None
+                    elif flatten_func == _flatten_tuple:
+                        tag = tags.TUPLE
+                    else:
+                        tag = tags.SET
+                    frames.push(_LIST, [], iter(obj), push, tag, obj, False)
+                    return _PENDING
+            else:
+                value = flatten_func(self, obj)
 
-        if flatten_func is None:
-            self._pickle_warning(obj)
-            return None
+        if push:
+            value = self._pop(value)
+        return value
+
+    def _flatten_obj_instance_step(self, obj, push, frames):
+        """Push a frame for a plain object or flatten it in one go"""
+        plan = _get_plan(obj)
+        if not plan.is_plain:
+            return self._flatten_on_path(obj, self._flatten_obj_instance, obj)
+
+        data = {}
+        if self.unpicklable:
+            data[tags.OBJECT] = plan.class_name
+
+        if plan.has_getstate:
+            try:
+                state = obj.__getstate__()
+            except TypeError:
+                # Has getstate but it cannot be called, e.g. file descriptors
+                # in Python3
+                self._pickle_warning(obj)
+                return None
+            frames.push(_STATE, data, iter((state,)), push, None, obj, True)
+            return _PENDING
+
+        if not plan.has_dict or util.is_iterator(obj):
+            return self._flatten_on_path(obj, self._flatten_obj_instance, obj)
+
+        # hack for zope persistent objects; this unghostifies the object
+        getattr(obj, '_', None)
+        attrs = obj.__dict__
+        if type(attrs) is not dict:
+            return self._flatten_on_path(obj, self._flatten_dict_obj,
+                                         attrs, data)
+        items = iter(self._items(attrs))
+        frames.push(_DICT, data, items, push, None, obj, True)
+        return _PENDING
 
-        return flatten_func(obj)
+    def _flatten_obj(self, obj):
+        max_reached = self._depth == self._max_depth
+
+        if max_reached or (not self.make_refs and self._is_repeat(obj)):
+            # break the cycle
+            return repr(obj)
+
+        try:
+            flatten_func = _flatteners[type(obj)]
+        except KeyError:
+            flatten_func = _get_flattener(type(obj))
+        if not self._cut_cycles or flatten_func == _flatten_primitive:
+            return flatten_func(self, obj)
+        return self._flatten_on_path(obj, flatten_func, self, obj)
 
     def _list_recurse(self, obj):
         return [self._flatten(v) for v in obj]
 
-    def _get_flattener(self, obj):
-
-        if PY2 and isinstance(obj, file):
-            return self._flatten_file
+    def _flatten_primitive(self, obj):
+        return obj
 
-        if util.is_primitive(obj):
-            return lambda obj: obj
+    def _flatten_list(self, obj):
+        if self._mkref(obj):
+            if self._is_plain_list(obj):
+                return obj[:]
+            return self._list_recurse(obj)
+        self._push()
+        return self._getref(obj)
 
-        list_recurse = self._list_recurse
+    # We handle tuples and sets by encoding them in a "(tuple|set)dict"
+    def _flatten_tuple(self, obj):
+        if self._is_plain_list(obj):
+            value = list(obj)
+        else:
+            value = self._list_recurse(obj)
+        if not self.unpicklable:
+            return value
+        return {tags.TUPLE: value}
 
-        if util.is_list(obj):
-            if self._mkref(obj):
-                return list_recurse
-            else:
-                self._push()
-                return self._getref
+    def _flatten_set(self, obj):
+        if self._is_plain_list(obj):
+            value = list(obj)
+        else:
+            value = self._list_recurse(obj)
+        if not self.unpicklable:
+            return value
+        return {tags.SET: value}
 
-        # We handle tuples and sets by encoding them in a "(tuple|set)dict"
-        if util.is_tuple(obj):
-            if not self.unpicklable:
-                return list_recurse
-            return lambda obj: {tags.TUPLE: [self._flatten(v) for v in obj]}
+    def _is_plain_list(self, obj):
+        """Return True if the items of `obj` flatten to themselves
 
-        if util.is_set(obj):
-            if not self.unpicklable:
-                return list_recurse
-            return lambda obj: {tags.SET: [self._flatten(v) for v in obj]}
+        Lists of numbers and strings are copied after one scan over the
+        types of their items instead of flattening every item.
 
-        if util.is_dictionary(obj):
-            return self._flatten_dict_obj
+        """
+        return (self._depth + 1 != self._max_depth and
+                _PLAIN_TYPES.issuperset(map(type, obj)))
 
-        if util.is_type(obj):
-            return _mktyperef
+    def _flatten_plain_dict(self, obj):
+        """Return the flattened dict `obj`, or None if it is not plain
 
-        if util.is_object(obj):
-            return self._ref_obj_instance
+        A dict of string keys and primitive values flattens to a copy of
+        itself, which is made without flattening every item.
 
+        """
+        if (not _PLAIN_TYPES.issuperset(map(type, obj.values())) or
+                not _PLAIN_KEY_TYPES.issuperset(map(type, obj)) or
+                not tags.RESERVED.isdisjoint(obj) or
+                self._depth + 1 == self._max_depth):
+            return None
+        if self.keys:
+            for k in obj:
+                if k.startswith(tags.JSON_KEY):
+                    return None
+        if not self._sort_keys:
+            return dict(obj)
+        keys = sorted(obj)
+        return dict(zip(keys, map(obj.__getitem__, keys)))
+
+    def _flatten_type(self, obj):
+        return _mktyperef(obj)
+
+    def _flatten_any_function(self, obj):
         if util.is_module_function(obj):
-            return self._flatten_function
+            return self._flatten_function(obj)
+        # lambdas and nested functions
+        return self._flatten_unsupported(obj)
 
+    def _flatten_unsupported(self, obj):
         # instance methods, lambdas, old style classes...
         self._pickle_warning(obj)
         return None
@@ -230,41 +839,23 @@ class Pickler(object):
         """Recursively flatten an instance and return a json-friendly dict
         """
         data = {}
-        has_class = hasattr(obj, '__class__')
-        has_dict = hasattr(obj, '__dict__')
-        has_slots = not has_dict and hasattr(obj, '__slots__')
-        has_getnewargs = util.has_method(obj, '__getnewargs__')
-        has_getnewargs_ex = util.has_method(obj, '__getnewargs_ex__')
-        has_getinitargs = util.has_method(obj, '__getinitargs__')
-        has_reduce, has_reduce_ex = util.has_reduce(obj)
-
-        # Support objects with __getstate__(); this ensures that
-        # both __setstate__() and __getstate__() are implemented
-        has_getstate = hasattr(obj, '__getstate__')
-        # not using has_method since __getstate__() is handled separately below
-
-        if has_class:
-            cls = obj.__class__
-        else:
-            cls = type(obj)
+        plan = _get_plan(obj)
 
         # Check for a custom handler
-        class_name = util.importable_name(cls)
-        handler = handlers.get(cls, handlers.get(class_name))
+        handler = plan.handler
         if handler is not None:
             if self.unpicklable:
-                data[tags.OBJECT] = class_name
+                data[tags.OBJECT] = plan.class_name
             return handler(self).flatten(obj, data)
 
         reduce_val = None
-        if has_class and not util.is_module(obj):
+        if plan.has_class and not plan.is_module:
             if self.unpicklable:
-                class_name = util.importable_name(cls)
-                data[tags.OBJECT] = class_name
+                data[tags.OBJECT] = plan.class_name
 
             # test for a reduce implementation, and redirect before doing anything else
             # if that is what reduce requests
-            if has_reduce_ex:
+            if plan.has_reduce_ex:
                 try:
                     # we're implementing protocol 2
                     reduce_val = obj.__reduce_ex__(2)
@@ -273,7 +864,7 @@ class Pickler(object):
                     # we ignore those
                     pass
 
-            if has_reduce and not reduce_val:
+            if plan.has_reduce and not reduce_val:
                 try:
                     reduce_val = obj.__reduce__()
                 except TypeError:
@@ -297,16 +888,16 @@ class Pickler(object):
                     # well, we can't do anything with that, so we ignore it
                     pass
 
-            if has_getnewargs_ex:
+            if plan.has_getnewargs_ex:
                 data[tags.NEWARGSEX] = list(map(self._flatten, obj.__getnewargs_ex__()))
 
-            if has_getnewargs and not has_getnewargs_ex:
+            if plan.has_getnewargs and not plan.has_getnewargs_ex:
                 data[tags.NEWARGS] = self._flatten(obj.__getnewargs__())
 
-            if has_getinitargs:
+            if plan.has_getinitargs:
                 data[tags.INITARGS] = self._flatten(obj.__getinitargs__())
 
-        if has_getstate:
+        if plan.has_getstate:
             try:
                 state = obj.__getstate__()
             except TypeError:
@@ -317,7 +908,7 @@ class Pickler(object):
             else:
                 return self._getstate(state, data)
 
-        if util.is_module(obj):
+        if plan.is_module:
             if self.unpicklable:
                 data[tags.REPR] = '%s/%s' % (obj.__name__,
                                              obj.__name__)
@@ -325,14 +916,14 @@ class Pickler(object):
                 data = unicode(obj)
             return data
 
-        if util.is_dictionary_subclass(obj):
+        if plan.is_dictionary_subclass:
             self._flatten_dict_obj(obj, data)
             return data
 
-        if util.is_sequence_subclass(obj):
+        if plan.is_sequence_subclass:
             return self._flatten_sequence_obj(obj, data)
 
-        if util.is_noncomplex(obj):
+        if plan.is_noncomplex:
             return [self._flatten(v) for v in obj]
 
         if util.is_iterator(obj):
@@ -363,17 +954,17 @@ class Pickler(object):
 
             return data
 
-        if has_dict:
+        if plan.has_dict:
             # Support objects that subclasses list and set
-            if util.is_sequence_subclass(obj):
+            if plan.is_sequence_subclass:
                 return self._flatten_sequence_obj(obj, data)
 
             # hack for zope persistent objects; this unghostifies the object
             getattr(obj, '_', None)
             return self._flatten_dict_obj(obj.__dict__, data)
 
-        if has_slots:
-            return self._flatten_newstyle_with_slots(obj, data)
+        if plan.has_slots:
+            return self._flatten_newstyle_with_slots(obj, data, plan.slots)
 
         # catchall return for data created above without a return
         # (e.g. __getnewargs__ is not supposed to be the end of the story)
@@ -391,14 +982,53 @@ class Pickler(object):
 
         return data
 
+    def _items(self, obj):
+        """Return the items of a dict in the order they are flattened in
+
+        >>> Pickler()._items({'b': 1, 'a': 2, 10: 3})
+        [(10, 3), ('a', 2), ('b', 1)]
+
+        When the backend sorts the keys of the JSON objects the items are
+        sorted by the keys they are written under, so that the references
+        are numbered in the order of the document.  So are the items of
+        dicts that do not keep their order, since the unpickler sorts them
+        by those keys.
+
+        """
+        if not self._sort_keys:
+            return list(obj.items())
+        if self._backend_sort_keys or not ORDERED_DICTS:
+            if (type(obj) is dict and not self.keys and
+                    _PLAIN_KEY_TYPES.issuperset(map(type, obj))):
+                return [(k, obj[k]) for k in sorted(obj)]
+            return sorted(obj.items(), key=self._written_key)
+        if type(obj) is dict:
+            # Sorting the keys with a builtin key function is much cheaper
+            # than calling util.itemgetter() for every item
+            return [(k, obj[k]) for k in sorted(obj, key=unicode)]
+        return sorted(obj.items(), key=util.itemgetter)
+
+    def _written_key(self, item):
+        """Return the key that the dict item `item` is written under"""
+        k = item[0]
+        if not self.keys or _is_plain_key(k):
+            return self._flatten_key(k)
+        # Flattening other keys would number the objects in them out of
+        # turn, so they are only placed among the other escaped keys
+        return tags.JSON_KEY + unicode(k)
+
     def _flatten_dict_obj(self, obj, data=None):
         """Recursively call flatten() and return json-friendly dict
         """
         if data is None:
+            if type(obj) is dict:
+                plain = self._flatten_plain_dict(obj)
+                if plain is not None:
+                    return plain
             data = obj.__class__()
 
         flatten = self._flatten_key_value_pair
-        for k, v in sorted(obj.items(), key=util.itemgetter):
+        for k, v in self._items(obj):
             flatten(k, v, data)
 
         # the collections.defaultdict protocol
@@ -436,13 +1066,10 @@ class Pickler(object):
             ok = True
         return ok
 
-    def _flatten_newstyle_with_slots(self, obj, data):
+    def _flatten_newstyle_with_slots(self, obj, data, allslots):
         """Return a json-friendly dict for new-style objects with __slots__.
         """
-        allslots = [_wrap_string_slot(getattr(cls, '__slots__', tuple()))
-                    for cls in obj.__class__.mro()]
-
-        if not self._flatten_obj_attrs(obj, chain(*allslots), data):
+        if not self._flatten_obj_attrs(obj, allslots, data):
             attrs = [x for x in dir(obj)
                      if not x.startswith('__') and not x.endswith('__')]
             self._flatten_obj_attrs(obj, attrs, data)
@@ -451,8 +1078,17 @@ class Pickler(object):
 
     def _flatten_key_value_pair(self, k, v, data):
         """Flatten a key/value pair into the passed-in dictionary."""
-        if not util.is_picklable(k, v):
+        if type(v) in _NON_FUNCTION_TYPES:
+            if k in tags.RESERVED:
+                return data
+        elif not util.is_picklable(k, v):
             return data
+        k = self._flatten_key(k)
+        data[k] = self._flatten(v)
+        return data
+
+    def _flatten_key(self, k):
+        """Return the string used to represent the dict key `k`"""
         if self.keys:
             if not isinstance(k, (str, unicode)) or k.startswith(tags.JSON_KEY):
                 k = self._escape_key(k)
@@ -464,9 +1100,7 @@ class Pickler(object):
                     k = repr(k)
                 except:
                     k = unicode(k)
-
-        data[k] = self._flatten(v)
-        return data
+        return k
 
     def _flatten_sequence_obj(self, obj, data):
         """Return a json-friendly dict for a sequence subclass."""
@@ -499,6 +1133,358 @@ class Pickler(object):
             warnings.warn(msg)
 
 
+# Frame kinds used by Pickler._flatten_iteratively()
+_LIST = 0
+_DICT = 1
+_STATE = 2
+# Returned by Pickler._flatten_step() when a frame has been pushed
+_PENDING = object()
+
+
+class _JSONWriter(object):
+    """Writes JSON text formatted the way a json or simplejson encoder does
+
+    Pickler.iterencode() writes the brackets, separators and keys of
+    containers itself and uses the encoder for everything else.
+
+    """
+
+    def __init__(self, encoder):
+        self.encode = encoder.encode
+        self.item_separator = encoder.item_separator
+        self.key_separator = encoder.key_separator
+        self.sort_keys = encoder.sort_keys
+        indent = encoder.indent
+        if indent is not None and not isinstance(indent, (str, unicode)):
+            indent = ' ' * indent
+        self.indent = indent
+        # simplejson can be told to write large ints as strings
+        self.plain_ints = not (getattr(encoder, 'bigint_as_string', False) or
+                               getattr(encoder, 'int_as_string_bitcount',
+                                       None))
+
+    def newline(self, level):
+        if self.indent is None:
+            return ''
+        return '\n' + self.indent * level
+
+    def value(self, value, level):
+        """Return the JSON text of a flattened value at `level`"""
+        if value is None:
+            return 'null'
+        if value is True:
+            return 'true'
+        if value is False:
+            return 'false'
+        if type(value) is int and self.plain_ints:
+            return str(value)
+        text = self.encode(value)
+        if self.indent is not None and level:
+            text = text.replace('\n', self.newline(level))
+        return text
+
+    def begin_item(self, write, out, opening):
+        """Write the bracket or separator that precedes an item"""
+        level = out[0]
+        if out[1]:
+            write(self.item_separator + self.newline(level + 1))
+        else:
+            if out[3] is not None:
+                # Open the dict that wraps a py/tuple or py/set list
+                write('{' + self.newline(level) +
+                      self.value(out[3], level) + self.key_separator)
+            write(opening + self.newline(level + 1))
+        out[1] += 1
+
+    def begin_key(self, write, out, key):
+        """Write the separator and key that precede a dict value"""
+        pending = out[2]
+        # Items that were in the dict before its children are written
+        # in order, or first when the encoder keeps the insertion order
+        while pending and (not self.sort_keys or pending[-1][0] < key):
+            self._write_pending(write, out)
+        self.begin_item(write, out, '{')
+        write(self.value(key, 0) + self.key_separator)
+
+    def _write_pending(self, write, out):
+        k, v = out[2].pop()
+        self.begin_item(write, out, '{')
+        write(self.value(k, 0) + self.key_separator +
+              self.value(v, out[0] + 1))
+
+    def end(self, write, out, opening, closing):
+        """Write the remaining items and the end of a container"""
+        while out[2]:
+            self._write_pending(write, out)
+        if out[1]:
+            write(self.newline(out[0]) + closing)
+        else:
+            if out[3] is not None:
+                write('{' + self.newline(out[0]) +
+                      self.value(out[3], out[0]) + self.key_separator)
+            write(opening + closing)
+
+
+class _Frames(list):
+    """The stack of frames used by Pickler._flatten_iteratively()
+
+    `ancestors` holds the ids of the objects that are being flattened.
+    It is shared with the pickler, so that the frames of nested walks
+    see the objects that enclose them.
+
+    `refs` is True when lists and objects that are met again become
+    references or their repr(), which ends any cycle that passes through
+    them, as it does for the recursive engine.  Otherwise every cycle
+    would recurse forever.
+
+    """
+    def __init__(self, ancestors, refs):
+        list.__init__(self)
+        self.ancestors = ancestors
+        self.refs = refs
+
+    def push(self, kind, data, items, pop, tag, obj, ref):
+        objid = id(obj)
+        added = objid not in self.ancestors
+        if added:
+            self.ancestors.add(objid)
+        elif not self._is_broken(objid):
+            raise ValueError('Circular reference detected')
+        self.append([kind, data, items, None, pop, tag, objid, ref, added])
+
+    def _is_broken(self, objid):
+        """Return True if the cycle back to `objid` ends after one round
+
+        A list or object between the enclosing frame of `objid` and the top
+        of the stack is a reference the next time it is met.  When `objid`
+        belongs to an enclosing walk, the object that started this walk
+        is such an object.
+
+        """
+        if not self.refs:
+            return False
+        for frame in reversed(self):
+            if frame[7]:
+                return True
+            if frame[6] == objid:
+                return False
+        return True
+
+    def finish(self):
+        """Pop the topmost frame, which is complete"""
+        frame = self.pop()
+        if frame[8]:
+            self.ancestors.discard(frame[6])
+
+    def abandon(self):
+        """Drop the frames that an error or an early exit left behind"""
+        for frame in self:
+            if frame[8]:
+                self.ancestors.discard(frame[6])
+        del self[:]
+
+
+# The number of chunks that Pickler.iterencode() joins before yielding
+_CHUNK_SIZE = 1024
+
+# The flatteners that the iterative engine unrolls into frames
+_flatten_primitive = Pickler._flatten_primitive
+_flatten_list = Pickler._flatten_list
+_flatten_tuple = Pickler._flatten_tuple
+_flatten_set = Pickler._flatten_set
+_flatten_dict_obj = Pickler._flatten_dict_obj
+_ref_obj_instance = Pickler._ref_obj_instance
+
+# Maps concrete types to the unbound Pickler method that flattens them.
+# Every instance of a type takes the same path through the pickler, so the
+# chain of type checks only runs once per type.  The table is cleared when
+# custom handlers are registered or unregistered.
+_flatteners = handlers.registry.add_cache({})
+
+# The types whose instances flatten to themselves
+_PLAIN_TYPES = frozenset(util.PRIMITIVES | set([type(None)]))
+# The types of the dict keys that are written out unchanged
+_PLAIN_KEY_TYPES = frozenset((str, unicode))
+# The types whose instances util.is_picklable() always accepts
+_NON_FUNCTION_TYPES = _PLAIN_TYPES | frozenset((list, dict, tuple, set))
+
+
+def _is_plain_key(obj):
+    """Return True if flattening the dict key `obj` numbers no objects
+
+    >>> _is_plain_key((1, ('a', None)))
+    True
+    >>> _is_plain_key((1, [2]))
+    False
+
+    """
+    cls = type(obj)
+    if cls in _PLAIN_TYPES:
+        return True
+    return cls is tuple and all(map(_is_plain_key, obj))
+
+
+def _is_plain(obj, keys=False):
+    """Return True if `obj` consists of lists and dicts of primitives only
+
+    Such a document flattens to itself when it is not unpicklable, as long
+    as no list or dict appears in it twice.
+
+    >>> _is_plain({'a': [1, 2.5, None, True, 'x'], 'b': {'c': (1,)}})
+    True
+    >>> _is_plain({'a': set([1])})
+    False
+    >>> _is_plain({1: 'a'})
+    False
+    >>> shared = [1]
+    >>> _is_plain([shared, shared])
+    False
+
+    """
+    if type(obj) in _PLAIN_TYPES:
+        return True
+    seen = set()
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        cls = type(obj)
+        if cls is list or cls is tuple:
+            values = obj
+        elif cls is dict:
+            if (not _PLAIN_KEY_TYPES.issuperset(map(type, obj)) or
+                    not tags.RESERVED.isdisjoint(obj)):
+                return False
+            if keys:
+                for k in obj:
+                    if k.startswith(tags.JSON_KEY):
+                        return False
+            values = obj.values()
+        else:
+            return False
+        # Shared and cyclical containers are flattened differently
+        if id(obj) in seen:
+            return False
+        seen.add(id(obj))
+        if not _PLAIN_TYPES.issuperset(map(type, values)):
+            stack.extend([v for v in values if type(v) not in _PLAIN_TYPES])
+    return True
+
+
+def _get_flattener(cls):
+    """Return the unbound Pickler method used to flatten instances of `cls`
+
+    >>> _get_flattener(int) == Pickler._flatten_primitive
+    True
+    >>> _get_flattener(dict) == Pickler._flatten_dict_obj
+    True
+
+    """
+    if PY2 and issubclass(cls, file):
+        flattener = Pickler._flatten_file
+    elif cls is type(None) or cls in util.PRIMITIVES:
+        flattener = Pickler._flatten_primitive
+    elif cls is list:
+        flattener = Pickler._flatten_list
+    elif cls is tuple:
+        flattener = Pickler._flatten_tuple
+    elif cls is set:
+        flattener = Pickler._flatten_set
+    elif cls is dict:
+        flattener = Pickler._flatten_dict_obj
+    elif issubclass(cls, type) or (PY2 and issubclass(cls, types.ClassType)):
+        flattener = Pickler._flatten_type
+    elif issubclass(cls, types.FunctionType):
+        # Only module-level functions can be referenced by name, which
+        # depends on the function itself and not on its type.
+        flattener = Pickler._flatten_any_function
+    else:
+        flattener = Pickler._ref_obj_instance
+    _flatteners[cls] = flattener
+    return flattener
+
+
+class _ClassPlan(object):
+    """Pickling decisions that depend only on the class of an instance
+
+    Looking up handlers and probing for the pickle protocol methods walks
+    the class hierarchy, so the results are computed once per class by
+    _get_plan() and shared by all of its instances.
+
+    """
+    def __init__(self, obj):
+        self.has_class = hasattr(obj, '__class__')
+        if self.has_class:
+            cls = obj.__class__
+        else:
+            cls = type(obj)
+        self.cls = cls
+        self.class_name = util.importable_name(cls)
+        self.handler = handlers.get(cls)
+
+        self.has_dict = hasattr(obj, '__dict__')
+        self.has_slots = not self.has_dict and hasattr(obj, '__slots__')
+        self.has_getnewargs = util.has_method(obj, '__getnewargs__')
+        self.has_getnewargs_ex = util.has_method(obj, '__getnewargs_ex__')
+        self.has_getinitargs = util.has_method(obj, '__getinitargs__')
+        self.has_reduce, self.has_reduce_ex = util.has_reduce(obj)
+        # Support objects with __getstate__(); this ensures that
+        # both __setstate__() and __getstate__() are implemented
+        # not using has_method since __getstate__() is handled separately
+        self.has_getstate = hasattr(obj, '__getstate__')
+
+        self.is_module = util.is_module(obj)
+        self.is_dictionary_subclass = util.is_dictionary_subclass(obj)
+        self.is_sequence_subclass = util.is_sequence_subclass(obj)
+        self.is_noncomplex = util.is_noncomplex(obj)
+        # Instances that are flattened from __getstate__() or __dict__ alone
+        self.is_plain = (self.handler is None and self.has_class and
+                         not (self.is_module or
+                              self.has_reduce or self.has_reduce_ex or
+                              self.has_getnewargs or self.has_getnewargs_ex or
+                              self.has_getinitargs or
+                              self.is_dictionary_subclass or
+                              self.is_sequence_subclass or
+                              self.is_noncomplex))
+
+        if self.has_slots:
+            self.slots = list(chain(*[
+                _wrap_string_slot(getattr(base, '__slots__', tuple()))
+                for base in cls.mro()]))
+        else:
+            self.slots = []
+
+
+# Maps classes to their _ClassPlan
+_plans = handlers.registry.add_cache({})
+
+
+# The attributes that _ClassPlan probes for on the instance itself
+_INSTANCE_PROBES = frozenset((
+    '__reduce__', '__reduce_ex__', '__getstate__', '__getnewargs__',
+    '__getnewargs_ex__', '__getinitargs__', '__getitem__', 'append'))
+
+
+def _get_plan(obj):
+    """Return the _ClassPlan for an instance, computing it when needed"""
+    cls = getattr(obj, '__class__', None)
+    attrs = getattr(obj, '__dict__', None)
+    if type(attrs) is dict and not _INSTANCE_PROBES.isdisjoint(attrs):
+        # The instance overrides its class, so it gets a plan of its own
+        return _ClassPlan(obj)
+    try:
+        return _plans[cls]
+    except KeyError:
+        pass
+    generation = handlers.registry.generation
+    plan = _ClassPlan(obj)
+    # Modules can define the protocol methods as globals, and objects
+    # that lie about their class are not described by that class.
+    if not plan.is_module and (type(obj) is cls or
+                               PY2 and type(obj) is types.InstanceType):
+        handlers.registry.store(_plans, cls, plan, generation)
+    return plan
+
+
 def _mktyperef(obj):
     """Return a typeref dictionary
 
@@ -14,24 +14,105 @@ import jsonpickle.tags as tags
 import jsonpickle.handlers as handlers
 
 from jsonpickle.compat import set
-from jsonpickle.backend import JSONBackend
+from jsonpickle.compat import PY2
+from jsonpickle.compat import unicode
+from jsonpickle.compat import ORDERED_DICTS
+from jsonpickle.backend import json as default_backend
 
 
 def decode(string, backend=None, context=None, keys=False, reset=True,
-           safe=False):
+           safe=False, iterative=False, single_pass=False, in_place=False,
+           class_cache=None, classes=None, import_classes=True,
+           sort_keys=False):
     backend = _make_backend(backend)
     if context is None:
-        context = Unpickler(keys=keys, backend=backend, safe=safe)
+        context = Unpickler(keys=keys, backend=backend, safe=safe,
+                            iterative=iterative, in_place=in_place,
+                            class_cache=class_cache, classes=classes,
+                            import_classes=import_classes,
+                            sort_keys=sort_keys)
+    if reset and isinstance(string, (str, unicode)):
+        # Old documents refer to objects by their path using "py/ref"
+        context._named_refs = _has_named_refs(string)
+        # Only the objects that "py/id" tags point to have to be tracked
+        context._referenced = _referenced_ids(string)
+    if single_pass and not context.keys:
+        decoder = backend.json_decoder(context._restore_pairs)
+        if decoder is not None:
+            try:
+                return context._decode_single_pass(decoder, string, reset)
+            except _MultiplePasses:
+                # References need the objects to be numbered in document
+                # order, so restore the document after it has been parsed
+                pass
     return context.restore(backend.decode(string), reset=reset)
 
 
 def _make_backend(backend):
     if backend is None:
-        return JSONBackend()
+        return default_backend
     else:
         return backend
 
 
+def _has_named_refs(string):
+    """Return True if a JSON string may contain "py/ref" tags"""
+    return tags.REF in string or 'py\\/ref' in string
+
+
+def _referenced_ids(string):
+    """Return the set of numbers used by the "py/id" tags in a JSON string
+
+    None is returned when the tags cannot all be found reliably, e.g.
+    when they are escaped inside of pickled dictionary keys.
+
+    >>> sorted(_referenced_ids('[{"py/id": 1}, {"py/id" : 12}]'))
+    [1, 12]
+    >>> _referenced_ids('{"json://{\\\\"py/id\\\\": 1}": 2}') is None
+    True
+
+    """
+    if 'py\\/id' in string:
+        return None
+    count = string.count(tags.ID)
+    if not count:
+        return set()
+    import re
+    ids = set()
+    for match in re.finditer(r'"py/id"\s*:\s*(\d+)', string):
+        ids.add(int(match.group(1)))
+        count -= 1
+    if count:
+        return None
+    return ids
+
+
+class _MultiplePasses(Exception):
+    """Raised when a document cannot be restored while it is parsed"""
+
+
+class _NamedReferences(Exception):
+    """Raised when a "py/ref" is found while names are not recorded"""
+
+
+def _restored(obj):
+    return obj
+
+
+def _without_factory(obj):
+    """Return the py/object dict `obj` without the factory it was built with
+
+    The dict is copied instead of modified, so that the document can be
+    restored again.
+
+    """
+    if 'default_factory' not in obj:
+        return obj
+    obj = obj.copy()
+    del obj['default_factory']
+    return obj
+
+
 class _Proxy(object):
     """Proxies are dummy objects that are later replaced by real instances
 
@@ -64,6 +145,33 @@ class _Proxy(object):
         self.instance = None
 
 
+# Frame kinds used by Unpickler._restore_iteratively()
+_LIST = 0
+_DICT = 1
+_OBJECT = 2
+_STATE = 3
+# Returned by Unpickler._restore_step() when a frame has been pushed
+_PENDING = object()
+
+# The tags that select how a dict is restored, in order of precedence,
+# and the names of the Unpickler methods that restore them
+_DISPATCH = (
+    (tags.ID, '_restore_id'),
+    (tags.REF, '_restore_ref'),  # Backwards compatibility
+    (tags.ITERATOR, '_restore_iterator'),
+    (tags.TYPE, '_restore_type'),
+    (tags.REPR, '_restore_repr'),  # Backwards compatibility
+    (tags.REDUCE, '_restore_reduce'),
+    (tags.OBJECT, '_restore_object'),
+    (tags.FUNCTION, '_restore_function'),
+    (tags.TUPLE, '_restore_tuple'),
+    (tags.SET, '_restore_set'),
+)
+_DISPATCH_TAGS = frozenset(tag for tag, name in _DISPATCH)
+_DISPATCH_RANKS = dict((tag, rank)
+                       for rank, (tag, name) in enumerate(_DISPATCH))
+
+
 def _obj_setattr(obj, attr, proxy):
     setattr(obj, attr, proxy.instance)
 
@@ -74,30 +182,70 @@ def _obj_setvalue(obj, idx, proxy):
 
 class Unpickler(object):
 
-    def __init__(self, backend=None, keys=False, safe=False):
+    def __init__(self, backend=None, keys=False, safe=False, iterative=False,
+                 in_place=False, class_cache=None, classes=None,
+                 import_classes=True, sort_keys=False):
         # The current recursion depth
         # Maps reference names to object instances
         self.backend = _make_backend(backend)
         self.keys = keys
         self.safe = safe
+        # Walk containers with an explicit stack instead of recursing
+        self.iterative = iterative
+        # Restore lists and dicts into the containers that are restored
+        self.in_place = in_place
+        # Maps class names to classes; can be shared between unpicklers
+        if class_cache is None:
+            class_cache = ClassCache()
+        self.class_cache = class_cache
+        # Maps class names to the classes that are known up front
+        self._classes = _make_classes(classes)
+        # Whether names missing from `classes` may be imported
+        self.import_classes = import_classes
+        # Restore the items of dicts sorted by key instead of in the
+        # order of the document, for documents whose backend did not
+        # preserve the order of the items.  Before Python 3.7 the parsed
+        # dicts do not keep the order of the document either.
+        self.sort_keys = sort_keys or not ORDERED_DICTS
 
         self._namedict = {}
         # The namestack grows whenever we recurse into a child object
         self._namestack = []
+        # Whether the namestack and namedict are maintained for "py/ref"
+        self._named = False
+        # Whether the document contains "py/ref", if decode() has checked
+        self._named_refs = None
+        # Whether restore() restores the document again if it needs names
+        self._rerun = False
+
+        # The "py/id" numbers in the document, if decode() has found them
+        self._referenced = None
+        # The numbers of the objects that are tracked, or None for all
+        self._live = None
+        # The number of the next object
+        self._count = 0
 
         # Maps objects to their index in the _objs list
         self._obj_to_idx = {}
         self._objs = []
         self._proxies = []
+        # Whether any proxies have been created, which values can refer to
+        self._proxied = False
 
     def reset(self):
         """Resets the object's internal state.
         """
         self._namedict = {}
         self._namestack = []
+        self._count = 0
         self._obj_to_idx = {}
-        self._objs = []
+        if self._live is None:
+            self._objs = []
+        else:
+            # Maps numbers to the objects that are referenced
+            self._objs = {}
         self._proxies = []
+        self._proxied = False
 
     def restore(self, obj, reset=True):
         """Restores a flattened object to its original python state.
@@ -110,47 +258,265 @@ class Unpickler(object):
         >>> u.restore({'key': 'value'})
         {'key': 'value'}
 
+        """
+        if not reset:
+            if not self._rerun:
+                # Nothing can restore the document again for us
+                self._named = True
+            return self._restore(obj)
+
+        self._live, self._referenced = self._referenced, None
+        self.reset()
+        named_refs, self._named_refs = self._named_refs, None
+        if named_refs or self._rerun:
+            self._named = True
+            value = self._restore(obj)
+        elif named_refs is None and self.in_place:
+            # The document is modified while it is restored
+            self._named = True
+            value = self._restore(obj)
+        else:
+            # Only old documents use "py/ref", so the paths to each object
+            # are only recorded once a "py/ref" has been found
+            self._named = False
+            self._rerun = True
+            try:
+                value = self._restore(obj)
+            except _NamedReferences:
+                self.reset()
+                self._named = True
+                value = self._restore(obj)
+            finally:
+                self._rerun = False
+        self._swap_proxies()
+        return value
+
+    def _decode_single_pass(self, decoder, string, reset=True):
+        """Restore each JSON object in `string` as soon as it is parsed
+
+        The decoder passes every JSON object to _restore_pairs() after the
+        objects nested inside of it have been restored, so the parsed
+        document is never walked a second time.  Children are returned
+        as-is by shadowing _restore() while the document is parsed.
+
+        _MultiplePasses is raised when the document contains references.
+
         """
         if reset:
+            self._live = None
             self.reset()
-        value = self._restore(obj)
-        if reset:
-            self._swap_proxies()
+        self._named = False
+        iterative = self.iterative
+        self.iterative = False
+        self._restore = _restored
+        try:
+            value = decoder.decode(string)
+        finally:
+            del self._restore
+            self.iterative = iterative
+        self._named_refs = None
+        self._referenced = None
         return value
 
+    def _restore_pairs(self, pairs):
+        """Restore a JSON object whose children have been restored"""
+        obj = dict(pairs)
+        if tags.RESERVED.isdisjoint(obj):
+            return obj
+        if tags.ID in obj or tags.REF in obj:
+            raise _MultiplePasses()
+        return Unpickler._restore(self, obj)
+
     def _swap_proxies(self):
         """Replace proxies with their corresponding instances"""
         for (obj, attr, proxy, method) in self._proxies:
             method(obj, attr, proxy)
 
     def _restore(self, obj):
-        if has_tag(obj, tags.ID):
-            restore = self._restore_id
-        elif has_tag(obj, tags.REF):  # Backwards compatibility
-            restore = self._restore_ref
-        elif has_tag(obj, tags.ITERATOR):
-            restore = self._restore_iterator
-        elif has_tag(obj, tags.TYPE):
-            restore = self._restore_type
-        elif has_tag(obj, tags.REPR):  # Backwards compatibility
-            restore = self._restore_repr
-        elif has_tag(obj, tags.REDUCE):
-            restore = self._restore_reduce
-        elif has_tag(obj, tags.OBJECT):
-            restore = self._restore_object
-        elif has_tag(obj, tags.FUNCTION):
-            restore = self._restore_function
-        elif util.is_list(obj):
-            restore = self._restore_list
-        elif has_tag(obj, tags.TUPLE):
-            restore = self._restore_tuple
-        elif has_tag(obj, tags.SET):
-            restore = self._restore_set
-        elif util.is_dictionary(obj):
-            restore = self._restore_dict
-        else:
-            restore = lambda x: x
-        return restore(obj)
+        if self.iterative:
+            return self._restore_iteratively(obj)
+        cls = type(obj)
+        if cls is dict:
+            if _DISPATCH_TAGS.isdisjoint(obj):
+                return self._restore_dict(obj)
+            return self._restore_tagged(obj)
+        if cls is list:
+            return self._restore_list(obj)
+        return obj
+
+    def _restore_tagged(self, obj):
+        """Restore a dict using its tag with the highest precedence"""
+        best = len(_DISPATCH)
+        ranks = _DISPATCH_RANKS
+        for key in obj:
+            rank = ranks.get(key, best)
+            if rank < best:
+                best = rank
+        return getattr(self, _DISPATCH[best][1])(obj)
+
+    def _restore_iteratively(self, obj):
+        """Restore `obj` using an explicit stack of partially built containers
+
+        This produces exactly the same objects as the recursive _restore(),
+        including the py/id numbering and proxy bookkeeping, but nesting
+        lists, tuples, sets, dicts and py/object instances does not consume
+        Python stack frames, so arbitrarily deep documents can be restored.
+
+        Each frame is a list of [kind, data, items, key, obj]: the container
+        or instance being filled, an iterator over the children that remain
+        to be restored, the key of the child being restored, and the value
+        being restored (or the type that a finished py/tuple or py/set
+        list is converted into).
+
+        Tags that rarely nest deeply, and objects with custom handlers,
+        are handed to the usual methods, whose children re-enter this
+        method through _restore().
+
+        """
+        restore_key = self._restore_key_fn()
+        named = self._named
+        namestack = self._namestack
+        frames = []
+        value = self._restore_step(obj, frames)
+        while frames:
+            frame = frames[-1]
+            kind, data, items = frame[0], frame[1], frame[2]
+
+            # Store the value of the child that has just been completed
+            if value is not _PENDING:
+                if kind == _LIST:
+                    data.append(value)
+                elif kind == _DICT:
+                    data[frame[3]] = value
+                    if named:
+                        namestack.pop()
+                elif kind == _OBJECT:
+                    self._restore_attr(data, frame[3], value)
+                    if named:
+                        namestack.pop()
+                else:
+                    frame[3] = value
+
+            # Restore children until one of them needs a frame of its own
+            value = _PENDING
+            if kind == _LIST:
+                for v in items:
+                    value = self._restore_step(v, frames)
+                    if value is _PENDING:
+                        break
+                    data.append(value)
+            elif kind == _DICT:
+                for k, v in items:
+                    if named:
+                        namestack.append(k)
+                    frame[3] = k = restore_key(k)
+                    value = self._restore_step(v, frames)
+                    if value is _PENDING:
+                        break
+                    data[k] = value
+                    if named:
+                        namestack.pop()
+            elif kind == _OBJECT:
+                for k, v in items:
+                    # ignore the reserved attribute
+                    if k in tags.RESERVED:
+                        continue
+                    if named:
+                        namestack.append(k)
+                    frame[3] = k = restore_key(k)
+                    value = self._restore_step(v, frames)
+                    if value is _PENDING:
+                        break
+                    self._restore_attr(data, k, value)
+                    if named:
+                        namestack.pop()
+            else:
+                for v in items:
+                    value = self._restore_step(v, frames)
+                    if value is _PENDING:
+                        break
+                    frame[3] = value
+            if value is _PENDING and frames[-1] is not frame:
+                continue
+
+            # All of the children are done so the frame is complete
+            if kind == _LIST:
+                if frame[4] is not None:
+                    data = frame[4](data)
+                elif self._proxied:
+                    self._proxies.extend([(data, idx, v, _obj_setvalue)
+                                          for idx, v in enumerate(data)
+                                          if isinstance(v, _Proxy)])
+            elif kind == _OBJECT:
+                obj = frame[4]
+                # Handle list and set subclasses
+                if has_tag(obj, tags.SEQ):
+                    self._restore_seq(obj, data)
+                if has_tag(obj, tags.STATE):
+                    # Restore the state in the same frame
+                    frame[0] = _STATE
+                    frame[2] = iter((obj[tags.STATE],))
+                    value = _PENDING
+                    continue
+            elif kind == _STATE:
+                data = self._restore_state_value(frame[3], data)
+            frames.pop()
+            value = data
+
+        return value
+
+    def _restore_step(self, obj, frames):
+        """Restore `obj`, or push a frame for it and return _PENDING"""
+        if type(obj) is list:
+            parent = []
+            self._mkref(parent)
+            frames.append([_LIST, parent, iter(obj), None, None])
+            return _PENDING
+        if type(obj) is not dict:
+            return obj
+        if _DISPATCH_TAGS.isdisjoint(obj):
+            items = iter(self._items(obj))
+            frames.append([_DICT, {}, items, None, None])
+            return _PENDING
+
+        if tags.ID in obj:
+            return self._restore_id(obj)
+        if tags.REF in obj:
+            return self._restore_ref(obj)
+        if tags.ITERATOR in obj:
+            return self._restore_iterator(obj)
+        if tags.TYPE in obj:
+            return self._restore_type(obj)
+        if tags.REPR in obj:
+            return self._restore_repr(obj)
+        if tags.REDUCE in obj:
+            return self._restore_reduce(obj)
+
+        if tags.OBJECT in obj:
+            class_name = obj[tags.OBJECT]
+            cls = self._loadclass(class_name)
+            handler = handlers.get(class_name if cls is None else cls)
+            if handler is not None or cls is None:
+                return self._restore_object(obj)
+            instance, complete = self._make_object_instance(obj, cls)
+            if complete:
+                return instance
+            items = iter(self._items(_without_factory(obj)))
+            frames.append([_OBJECT, instance, items, None, obj])
+            return _PENDING
+
+        if tags.FUNCTION in obj:
+            return self._restore_function(obj)
+        if tags.TUPLE in obj:
+            frames.append([_LIST, [], iter(obj[tags.TUPLE]), None, tuple])
+            return _PENDING
+        if tags.SET in obj:
+            frames.append([_LIST, [], iter(obj[tags.SET]), None, set])
+            return _PENDING
+
+        items = iter(self._items(obj))
+        frames.append([_DICT, {}, items, None, None])
+        return _PENDING
 
     def _restore_iterator(self, obj):
         return iter(self._restore_list(obj[tags.ITERATOR]))
@@ -200,10 +566,12 @@ class Unpickler(object):
         return self._objs[obj[tags.ID]]
 
     def _restore_ref(self, obj):
+        if not self._named:
+            raise _NamedReferences()
         return self._namedict.get(obj[tags.REF])
 
     def _restore_type(self, obj):
-        typeref = loadclass(obj[tags.TYPE])
+        typeref = self._loadclass(obj[tags.TYPE])
         if typeref is None:
             return obj
         return typeref
@@ -212,13 +580,19 @@ class Unpickler(object):
         if self.safe:
             # eval() is not allowed in safe mode
             return None
+        if not self.import_classes:
+            # loadrepr() imports the module and evaluates the repr
+            return self._mkref(obj)
         obj = loadrepr(obj[tags.REPR])
         return self._mkref(obj)
 
     def _restore_object(self, obj):
         class_name = obj[tags.OBJECT]
-        cls = loadclass(class_name)
-        handler = handlers.get(cls, handlers.get(class_name))
+        cls = self._loadclass(class_name)
+        if cls is None and not self.import_classes:
+            # names that are not in `classes` are left alone
+            return self._mkref(obj)
+        handler = handlers.get(class_name if cls is None else cls)
         if handler is not None:  # custom handler
             instance = handler(self).restore(obj)
             return self._mkref(instance)
@@ -229,31 +603,63 @@ class Unpickler(object):
         return self._restore_object_instance(obj, cls)
 
     def _restore_function(self, obj):
-        return loadclass(obj[tags.FUNCTION])
+        return self._loadclass(obj[tags.FUNCTION])
 
-    def _loadfactory(self, obj):
+    def _loadclass(self, module_and_name):
         try:
-            default_factory = obj['default_factory']
-        except KeyError:
+            return self._classes[module_and_name]
+        except (KeyError, TypeError):
+            pass
+        if not self.import_classes:
+            return None
+        return self.class_cache.load(module_and_name)
+
+    def _loadfactory(self, obj):
+        if 'default_factory' not in obj:
             return None
-        del obj['default_factory']
-        return self._restore(default_factory)
+        return self._restore(obj['default_factory'])
 
     def _restore_object_instance(self, obj, cls):
-        # This is a placeholder proxy object which allows child objects to
-        # reference the parent object before it has been instantiated.
-        proxy = _Proxy()
-        self._mkref(proxy)
+        instance, complete = self._make_object_instance(obj, cls)
+        if complete:
+            return instance
+        return self._restore_object_instance_variables(_without_factory(obj),
+                                                       instance)
 
-        # An object can install itself as its own factory, so load the factory
-        # after the instance is available for referencing.
-        factory = self._loadfactory(obj)
+    def _make_object_instance(self, obj, cls):
+        """Construct the instance for a py/object before restoring its state
 
+        Returns an (instance, complete) tuple.  `complete` is True when
+        the instance must be returned without restoring its variables.
+
+        """
         if has_tag(obj, tags.NEWARGSEX):
             args, kwargs = obj[tags.NEWARGSEX]
         else:
-            args = getargs(obj)
+            args = getargs(obj, cls)
             kwargs = {}
+
+        # Objects that are built from plain __new__() plus state are created
+        # before anything else is restored, so they are registered directly.
+        # Arguments and factories are restored before the instance exists.
+        deferred = bool(args or kwargs or 'default_factory' in obj)
+        proxy = None
+        if deferred:
+            if self._live is None or self._count in self._live:
+                # This is a placeholder proxy object which allows child
+                # objects to reference the parent object before it has
+                # been instantiated.
+                proxy = _Proxy()
+                self._proxied = True
+                self._mkref(proxy)
+            else:
+                # Nothing refers to this object
+                self._mkref(None)
+
+        # An object can install itself as its own factory, so load the factory
+        # after the instance is available for referencing.
+        factory = self._loadfactory(obj)
+
         if args:
             args = self._restore(args)
         if kwargs:
@@ -279,65 +685,110 @@ class Unpickler(object):
                 try:
                     instance = make_blank_classic(cls)
                 except:  # fail gracefully
-                    return self._mkref(obj)
+                    if not deferred:
+                        # Take the place of the instance
+                        self._mkref(_Proxy())
+                    return self._mkref(obj), True
 
-        proxy.instance = instance
-        self._swapref(proxy, instance)
+        if not deferred:
+            self._mkref(instance)
+        else:
+            if proxy is not None:
+                proxy.instance = instance
+            self._swapref(proxy, instance)
 
         if isinstance(instance, tuple):
-            return instance
+            return instance, True
 
-        if (hasattr(instance, 'default_factory') and
+        if (deferred and hasattr(instance, 'default_factory') and
                 type(instance.default_factory) is _Proxy):
             instance.default_factory = instance.default_factory.instance
 
-        return self._restore_object_instance_variables(obj, instance)
+        return instance, False
 
     def _restore_from_dict(self, obj, instance, ignorereserved=True):
+        if (not self._named and not self.keys and
+                _has_plain_dict(type(instance))):
+            attrs = getattr(instance, '__dict__', None)
+            if type(attrs) is dict:
+                self._restore_into_dict(obj, instance, attrs, ignorereserved)
+                return
+
         restore_key = self._restore_key_fn()
-        method = _obj_setattr
+        restore_attr = self._restore_attr
+        named = self._named
 
-        for k, v in sorted(obj.items(), key=util.itemgetter):
+        for k, v in self._items(obj):
             # ignore the reserved attribute
             if ignorereserved and k in tags.RESERVED:
                 continue
-            self._namestack.append(k)
+            if named:
+                self._namestack.append(k)
             k = restore_key(k)
             # step into the namespace
-            value = self._restore(v)
-            if (util.is_noncomplex(instance) or
-                    util.is_dictionary_subclass(instance)):
-                instance[k] = value
-            else:
-                setattr(instance, k, value)
+            restore_attr(instance, k, self._restore(v))
+            # step out
+            if named:
+                self._namestack.pop()
 
-            # This instance has an instance variable named `k` that is
-            # currently a proxy and must be replaced
-            if type(value) is _Proxy:
-                self._proxies.append((instance, k, value, method))
+    def _restore_into_dict(self, obj, instance, attrs, ignorereserved):
+        """Store restored instance variables directly in `attrs`
 
-            # step out
-            self._namestack.pop()
+        This is the fast path of _restore_from_dict() for instances whose
+        attributes can be assigned without going through setattr().
+
+        """
+        restore = self._restore
+        for k, v in self._items(obj):
+            # ignore the reserved attribute
+            if ignorereserved and k in tags.RESERVED:
+                continue
+            if PY2:
+                # setattr() stores attribute names as native strings
+                k = str(k)
+            attrs[k] = value = restore(v)
+            if self._proxied and type(value) is _Proxy:
+                self._proxies.append((instance, k, value, _obj_setattr))
+
+    def _restore_attr(self, instance, k, value):
+        """Assign a restored instance variable"""
+        if (util.is_noncomplex(instance) or
+                util.is_dictionary_subclass(instance)):
+            instance[k] = value
+        else:
+            setattr(instance, k, value)
+
+        # This instance has an instance variable named `k` that is
+        # currently a proxy and must be replaced
+        if self._proxied and type(value) is _Proxy:
+            self._proxies.append((instance, k, value, _obj_setattr))
 
     def _restore_object_instance_variables(self, obj, instance):
         self._restore_from_dict(obj, instance)
 
         # Handle list and set subclasses
         if has_tag(obj, tags.SEQ):
-            if hasattr(instance, 'append'):
-                for v in obj[tags.SEQ]:
-                    instance.append(self._restore(v))
-            if hasattr(instance, 'add'):
-                for v in obj[tags.SEQ]:
-                    instance.add(self._restore(v))
+            self._restore_seq(obj, instance)
 
         if has_tag(obj, tags.STATE):
             instance = self._restore_state(obj, instance)
 
         return instance
 
+    def _restore_seq(self, obj, instance):
+        if hasattr(instance, 'append'):
+            for v in obj[tags.SEQ]:
+                instance.append(self._restore(v))
+        if hasattr(instance, 'add'):
+            for v in obj[tags.SEQ]:
+                instance.add(self._restore(v))
+
     def _restore_state(self, obj, instance):
         state = self._restore(obj[tags.STATE])
+        return self._restore_state_value(state, instance)
+
+    def _restore_state_value(self, state, instance):
+        """Apply an already restored py/state value to `instance`"""
         has_slots = (isinstance(state, tuple) and len(state) == 2
                      and isinstance(state[1], dict))
         has_slots_and_dict = has_slots and isinstance(state[0], dict)
@@ -363,15 +814,24 @@ class Unpickler(object):
         return instance
 
     def _restore_list(self, obj):
-        parent = []
-        self._mkref(parent)
-        children = [self._restore(v) for v in obj]
-        parent.extend(children)
-        method = _obj_setvalue
-        proxies = [(parent, idx, value, method)
-                   for idx, value in enumerate(parent)
-                   if isinstance(value, _Proxy)]
-        self._proxies.extend(proxies)
+        if self.in_place:
+            parent = obj
+            self._mkref(parent)
+            for idx, v in enumerate(obj):
+                value = self._restore(v)
+                if value is not v:
+                    parent[idx] = value
+        else:
+            parent = []
+            self._mkref(parent)
+            children = [self._restore(v) for v in obj]
+            parent.extend(children)
+        if self._proxied:
+            method = _obj_setvalue
+            proxies = [(parent, idx, value, method)
+                       for idx, value in enumerate(parent)
+                       if isinstance(value, _Proxy)]
+            self._proxies.extend(proxies)
         return parent
 
     def _restore_tuple(self, obj):
@@ -381,15 +841,35 @@ class Unpickler(object):
         return set([self._restore(v) for v in obj[tags.SET]])
 
     def _restore_dict(self, obj):
+        named = self._named
+        if self.in_place and not self.keys:
+            for k, v in self._items(obj):
+                if named:
+                    self._namestack.append(k)
+                value = self._restore(v)
+                if value is not v:
+                    obj[k] = value
+                if named:
+                    self._namestack.pop()
+            return obj
+
         data = {}
         restore_key = self._restore_key_fn()
-        for k, v in sorted(obj.items(), key=util.itemgetter):
-            self._namestack.append(k)
+        for k, v in self._items(obj):
+            if named:
+                self._namestack.append(k)
             k = restore_key(k)
             data[k] = self._restore(v)
-            self._namestack.pop()
+            if named:
+                self._namestack.pop()
         return data
 
+    def _items(self, obj):
+        """Return the items of a dict in the order they are restored in"""
+        if self.sort_keys:
+            return sorted(obj.items(), key=util.itemgetter)
+        return obj.items()
+
     def _restore_key_fn(self):
         """Return a callable that restores keys
 
@@ -442,6 +922,16 @@ class Unpickler(object):
         return '/' + '/'.join(self._namestack)
 
     def _mkref(self, obj):
+        if self._live is not None:
+            # Only objects that are referenced by "py/id" are kept
+            idx = self._count
+            self._count += 1
+            if idx in self._live:
+                self._objs[idx] = obj
+            if self._named:
+                self._namedict[self._refname()] = obj
+            return obj
+
         obj_id = id(obj)
         try:
             self._obj_to_idx[obj_id]
@@ -450,18 +940,71 @@ class Unpickler(object):
             self._objs.append(obj)
             # Backwards compatibility: old versions of jsonpickle
             # produced "py/ref" references.
-            self._namedict[self._refname()] = obj
+            if self._named:
+                self._namedict[self._refname()] = obj
         return obj
 
     def _swapref(self, proxy, instance):
-        proxy_id = id(proxy)
-        instance_id = id(instance)
+        if self._live is not None:
+            idx = self._count - 1
+            if idx in self._live:
+                self._objs[idx] = instance
+        else:
+            proxy_id = id(proxy)
+            instance_id = id(instance)
+
+            self._obj_to_idx[instance_id] = self._obj_to_idx[proxy_id]
+            del self._obj_to_idx[proxy_id]
 
-        self._obj_to_idx[instance_id] = self._obj_to_idx[proxy_id]
-        del self._obj_to_idx[proxy_id]
+            self._objs[-1] = instance
+        if self._named:
+            self._namedict[self._refname()] = instance
 
-        self._objs[-1] = instance
-        self._namedict[self._refname()] = instance
+
+# Maps classes to whether their attributes can be stored in their __dict__.
+# It is emptied along with the handler caches, so that classes do not stay
+# referenced for good.
+_plain_classes = handlers.registry.add_cache({})
+
+
+def _has_plain_dict(cls):
+    """Return True if setting attributes on instances of `cls` only
+    stores them in the instance's __dict__
+
+    That is the case when the class does not override __setattr__(),
+    is not a dict subclass, and has no data descriptors, e.g. properties
+    or slots, that assignments would go through.
+
+    >>> class Thing(object):
+    ...     pass
+    >>> _has_plain_dict(Thing)
+    True
+    >>> class Slotted(object):
+    ...     __slots__ = ('name', '__dict__')
+    >>> _has_plain_dict(Slotted)
+    False
+
+    """
+    try:
+        return _plain_classes[cls]
+    except KeyError:
+        pass
+    plain = (getattr(cls, '__setattr__', None) is object.__setattr__ and
+             not issubclass(cls, dict))
+    if plain:
+        for base in getattr(cls, '__mro__', ()):
+            if base is object:
+                continue
+            for name, value in vars(base).items():
+                if name.startswith('__') and name.endswith('__'):
+                    continue
+                if hasattr(type(value), '__set__'):
+                    plain = False
+                    break
+            if not plain:
+                break
+    _plain_classes[cls] = plain
+    return plain
 
 
 def loadclass(module_and_name):
@@ -486,7 +1029,81 @@ def loadclass(module_and_name):
         return None
 
 
-def getargs(obj):
+class ClassCache(object):
+    """A bounded cache of the classes loaded by loadclass()
+
+    Maps qualified names to classes.  A cached class is only used while its
+    module is still the one in `sys.modules` and still holds the class, so
+    reloaded modules are picked up.  Names that could not be loaded are not
+    cached, because importing them may succeed later.  The cache can be
+    shared by unpicklers.
+
+    >>> cache = ClassCache()
+    >>> cache.load('datetime.datetime') is cache.load('datetime.datetime')
+    True
+    >>> cache.hits, cache.misses
+    (1, 1)
+
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        # Maps names to (class, module, attribute name) tuples
+        self._classes = {}
+
+    def load(self, module_and_name):
+        """Return the class named `module_and_name`, or None"""
+        try:
+            cls, module, name = self._classes[module_and_name]
+        except KeyError:
+            pass
+        except TypeError:
+            # not a name at all
+            return loadclass(module_and_name)
+        else:
+            if (sys.modules.get(module.__name__) is module and
+                    module.__dict__.get(name) is cls):
+                self.hits += 1
+                return cls
+
+        self.misses += 1
+        cls = loadclass(module_and_name)
+        if cls is None:
+            return None
+        if len(self._classes) >= self.maxsize:
+            self._classes.clear()
+        module, name = module_and_name.rsplit('.', 1)
+        module = sys.modules[util.untranslate_module_name(module)]
+        self._classes[module_and_name] = (cls, module, name)
+        return cls
+
+    def clear(self):
+        self._classes.clear()
+
+
+def _make_classes(classes):
+    """Return a dict that maps class names to the classes in `classes`
+
+    `classes` can be a dict of names and classes, a single class or
+    function, or a sequence of them.
+
+    >>> _make_classes([ClassCache]) == {
+    ...     'jsonpickle.unpickler.ClassCache': ClassCache}
+    True
+
+    """
+    if not classes:
+        return {}
+    if isinstance(classes, dict):
+        return dict(classes)
+    if not isinstance(classes, (list, tuple, set, frozenset)):
+        classes = (classes,)
+    return dict((util.importable_name(cls), cls) for cls in classes)
+
+
+def getargs(obj, cls=None):
     """Return arguments suitable for __new__()"""
     # Let saved newargs take precedence over everything
     if has_tag(obj, tags.NEWARGSEX):
@@ -503,7 +1120,10 @@ def getargs(obj):
         obj_dict = obj[tags.OBJECT]
     except KeyError:
         return []
-    typeref = loadclass(obj_dict)
+    if cls is not None:
+        typeref = cls
+    else:
+        typeref = loadclass(obj_dict)
     if not typeref:
         return []
     if hasattr(typeref, '_fields'):
@@ -9,13 +9,11 @@
 """Helper functions for pickling and unpickling.  Most functions assist in
 determining the type of an object.
 """
-import base64
 import collections
 import io
 import operator
 import time
 import types
-import inspect
 
 from jsonpickle import tags
 from jsonpickle.compat import set
@@ -68,6 +66,7 @@ def has_method(obj, name):
     # need to go through __dict__'s since in py3 methods are essentially descriptors
     base_type = obj if is_type(obj) else obj.__class__  # __class__ for old-style classes
     original = None
+    import inspect
     for subtype in inspect.getmro(base_type):  # there is no .mro() for old-style classes
         original = vars(subtype).get(name)
         if original is not None:
@@ -453,6 +452,7 @@ def importable_name(cls):
 
 
 def b64encode(data):
+    import base64
     payload = base64.b64encode(data)
     if PY3 and type(payload) is bytes:
         payload = payload.decode('ascii')
@@ -460,6 +460,7 @@ def b64encode(data):
 
 
 def b64decode(payload):
+    import base64
     if PY3 and type(payload) is not bytes:
         payload = bytes(payload, 'ascii')
     return base64.b64decode(payload)
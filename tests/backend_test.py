@@ -65,6 +65,26 @@ class BackendBase(unittest.TestCase):
         actual = jsonpickle.decode(pickle)
         self.assertEqual(expect, actual)
 
+    def test_iterencode(self):
+        """Ensure that iterencode() writes the same text as encode()"""
+        shared = [1, 2]
+        data = {'things': [Thing('data'), (shared, set([3]))],
+                'shared': shared, 'empty': [{}, [], ()], 1: None}
+        expect = jsonpickle.encode(data)
+        actual = ''.join(jsonpickle.iterencode(data))
+        self.assertEqual(expect, actual)
+
+    def test_iterencode_cycle_through_dict(self):
+        """Ensure that iterencode() writes references that end cycles"""
+        thing = Thing('thing')
+        data = {'k': thing}
+        thing.child = data
+        expect = jsonpickle.encode(data)
+        actual = ''.join(jsonpickle.iterencode(data))
+        self.assertEqual(expect, actual)
+        restored = jsonpickle.decode(actual)
+        self.assertTrue(restored['k'].child['k'] is restored['k'])
+
 
 class JsonTestCase(BackendBase):
     def setUp(self):
@@ -79,6 +99,26 @@ class JsonTestCase(BackendBase):
             ']}')
         self.assertEncodeDecode(expected_pickled)
 
+    def test_iterencode_encoder_options(self):
+        data = {'things': [Thing('data'), (1, 2), ()], 'empty': {}}
+        try:
+            for options in ({'sort_keys': True},
+                            {'indent': 2},
+                            {'indent': 4, 'sort_keys': True},
+                            {'separators': (',', ':')}):
+                jsonpickle.set_encoder_options('json', **options)
+                expect = jsonpickle.encode(data)
+                actual = ''.join(jsonpickle.iterencode(data))
+                self.assertEqual(expect, actual)
+        finally:
+            jsonpickle.set_encoder_options('json')
+
+    def test_iterencode_chunks(self):
+        data = [Thing('thing%d' % i) for i in range(10000)]
+        chunks = list(jsonpickle.iterencode(data))
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(jsonpickle.encode(data), ''.join(chunks))
+
 
 class SimpleJsonTestCase(BackendBase):
     def setUp(self):
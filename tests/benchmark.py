@@ -7,31 +7,300 @@
 # This software is licensed as described in the file COPYING, which
 # you should have received as part of this distribution.
 
+"""Micro-benchmarks for jsonpickle's hot paths.
+
+Run every benchmark, or only the named ones::
+
+    python benchmark.py [-n NODES] [-r REPEAT] [name ...]
+
+Each benchmark reports the best wall-clock time out of REPEAT runs so that
+revisions of the pickler and unpickler can be compared against each other.
+"""
+from __future__ import print_function
+
+import optparse
+import os
+import subprocess
 import sys
 import timeit
 
-IS_25_DOWN = sys.version_info[:2] <= (2, 5)
+testdir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(1, os.path.dirname(testdir))
+
+import jsonpickle
+import jsonpickle.pickler
+import jsonpickle.unpickler
 
-number = 1000
 
-mod = 'json'
-if IS_25_DOWN:
-    mod = 'simplejson'
+BENCHMARKS = []
 
-json = """\
-import feedparser
-import jsonpickle
-import jsonpickle.tests.thirdparty_tests as test
-doc = feedparser.parse(test.RSS_DOC)
 
-jsonpickle.set_preferred_backend('%s')
+def benchmark(func):
+    """Register a benchmark
+
+    Benchmarks take the requested graph size and return a callable
+    that performs the operation being measured.
+
+    """
+    BENCHMARKS.append(func)
+    return func
+
+
+class Thing(object):
+
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+        self.tags = [1, 2]
+        self.meta = {'a': 1, 'b': None}
+        self.pair = (1, 'x')
+
+
+def mixed_graph(nodes):
+    """Return a list holding about `nodes` values of mixed types
+
+    Each record is a user object holding strings, floats, lists,
+    dicts and tuples, which accounts for thirteen values in total.
+
+    """
+    return [Thing('thing%d' % i, i * 0.5) for i in range(nodes // 13)]
+
+
+def builtin_graph(nodes):
+    """Return a list holding about `nodes` values of builtin types"""
+    return [{'name': 'thing%d' % i, 'value': i * 0.5,
+             'tags': [1, 2], 'pair': (1, 'x')}
+            for i in range(nodes // 10)]
+
+
+@benchmark
+def import_jsonpickle(nodes):
+    """Start a Python interpreter that imports jsonpickle"""
+    command = [sys.executable, '-c', 'import jsonpickle']
+    return lambda: subprocess.check_call(command, cwd=os.path.dirname(testdir))
+
+
+@benchmark
+def flatten_builtin(nodes):
+    """Pickler.flatten() on a graph of dicts, lists and tuples"""
+    obj = builtin_graph(nodes)
+    pickler = jsonpickle.pickler.Pickler()
+    return lambda: pickler.flatten(obj)
+
+
+@benchmark
+def flatten_mixed(nodes):
+    """Pickler.flatten() on a graph of builtin and user objects"""
+    obj = mixed_graph(nodes)
+    pickler = jsonpickle.pickler.Pickler()
+    return lambda: pickler.flatten(obj)
+
+
+@benchmark
+def flatten_mixed_json(nodes):
+    """Pickler(unpicklable=False).flatten() on the same graph"""
+    obj = mixed_graph(nodes)
+    pickler = jsonpickle.pickler.Pickler(unpicklable=False)
+    return lambda: pickler.flatten(obj)
+
+
+@benchmark
+def flatten_mixed_no_refs(nodes):
+    """Pickler(make_refs=False).flatten() on the same graph"""
+    obj = mixed_graph(nodes)
+    pickler = jsonpickle.pickler.Pickler(make_refs=False)
+    return lambda: pickler.flatten(obj)
+
+
+@benchmark
+def flatten_no_refs_ancestors(nodes):
+    """Pickler(make_refs=False, cycle_check='ancestors').flatten()"""
+    obj = mixed_graph(nodes)
+    pickler = jsonpickle.pickler.Pickler(make_refs=False,
+                                         cycle_check='ancestors')
+    return lambda: pickler.flatten(obj)
+
+
+@benchmark
+def encode_mixed(nodes):
+    """jsonpickle.encode() on a graph of builtin and user objects"""
+    obj = mixed_graph(nodes)
+    return lambda: jsonpickle.encode(obj)
+
+
+def wide_dict(nodes):
+    """Return a dict with `nodes` string keys and int values"""
+    return dict(('key%d' % i, i) for i in range(nodes))
+
+
+@benchmark
+def encode_wide_dict(nodes):
+    """jsonpickle.encode() on a dict with one key per node"""
+    obj = wide_dict(nodes)
+    return lambda: jsonpickle.encode(obj)
+
+
+@benchmark
+def encode_wide_dict_insertion(nodes):
+    """jsonpickle.encode(key_order='insertion') on the same dict"""
+    obj = wide_dict(nodes)
+    return lambda: jsonpickle.encode(obj, key_order='insertion')
+
+
+@benchmark
+def encode_floats(nodes):
+    """jsonpickle.encode() on a list of floats"""
+    obj = [i * 0.5 for i in range(nodes)]
+    return lambda: jsonpickle.encode(obj)
+
+
+@benchmark
+def encode_metrics(nodes):
+    """jsonpickle.encode(unpicklable=False) on dicts of metrics"""
+    obj = [wide_dict(100) for i in range(nodes // 100)]
+    return lambda: jsonpickle.encode(obj, unpicklable=False)
+
+
+@benchmark
+def encode_records(nodes):
+    """jsonpickle.encode() on each record, written one per line"""
+    records = mixed_graph(nodes)
+    fp = open(os.devnull, 'w')
+
+    def encode_records():
+        for record in records:
+            fp.write(jsonpickle.encode(record) + '\n')
+    return encode_records
+
+
+@benchmark
+def dump_lines_records(nodes):
+    """jsonpickle.dump_lines() on the same records"""
+    records = mixed_graph(nodes)
+    fp = open(os.devnull, 'w')
+    return lambda: jsonpickle.dump_lines(records, fp)
+
+
+@benchmark
+def decode_records(nodes):
+    """jsonpickle.decode() on each line of a JSON Lines document"""
+    lines = [jsonpickle.encode(record) + '\n'
+             for record in mixed_graph(nodes)]
+    return lambda: [jsonpickle.decode(line) for line in lines]
+
+
+@benchmark
+def iter_load_lines_records(nodes):
+    """jsonpickle.iter_load_lines() on the same lines"""
+    lines = [jsonpickle.encode(record) + '\n'
+             for record in mixed_graph(nodes)]
+    return lambda: list(jsonpickle.iter_load_lines(lines))
+
+
+@benchmark
+def decode_wide_dict(nodes):
+    """jsonpickle.decode() on a dict with one key per node"""
+    pickle = jsonpickle.encode(wide_dict(nodes))
+    return lambda: jsonpickle.decode(pickle)
+
+
+@benchmark
+def decode_wide_dict_sorted(nodes):
+    """jsonpickle.decode(sort_keys=True) on the same dict"""
+    pickle = jsonpickle.encode(wide_dict(nodes))
+    return lambda: jsonpickle.decode(pickle, sort_keys=True)
+
+
+@benchmark
+def iterencode_mixed(nodes):
+    """jsonpickle.iterencode() on the same graph, discarding the chunks"""
+    obj = mixed_graph(nodes)
+    return lambda: [chunk for chunk in jsonpickle.iterencode(obj)]
+
+
+@benchmark
+def decode_mixed(nodes):
+    """jsonpickle.decode() on a graph of builtin and user objects"""
+    text = jsonpickle.encode(mixed_graph(nodes))
+    return lambda: jsonpickle.decode(text)
+
+
+@benchmark
+def decode_mixed_single_pass(nodes):
+    """jsonpickle.decode(single_pass=True) on the same graph"""
+    text = jsonpickle.encode(mixed_graph(nodes))
+    return lambda: jsonpickle.decode(text, single_pass=True)
+
+
+@benchmark
+def decode_builtin(nodes):
+    """jsonpickle.decode() on a graph of dicts, lists and tuples"""
+    text = jsonpickle.encode(builtin_graph(nodes))
+    return lambda: jsonpickle.decode(text)
+
+
+@benchmark
+def decode_builtin_in_place(nodes):
+    """jsonpickle.decode(in_place=True) on the same graph"""
+    text = jsonpickle.encode(builtin_graph(nodes))
+    return lambda: jsonpickle.decode(text, in_place=True)
+
+
+def deep_graph(nodes):
+    """Return `nodes` lists and dicts nested inside each other"""
+    flattened = []
+    for i in range(nodes // 2):
+        flattened = {'k': [flattened]}
+    return flattened
+
+
+@benchmark
+def restore_builtin(nodes):
+    """Unpickler.restore() on a flattened graph of dicts and lists"""
+    obj = jsonpickle.pickler.Pickler().flatten(builtin_graph(nodes))
+    unpickler = jsonpickle.unpickler.Unpickler()
+    return lambda: unpickler.restore(obj)
+
+
+@benchmark
+def restore_wide(nodes):
+    """Unpickler.restore() on a flattened graph of user objects"""
+    obj = jsonpickle.pickler.Pickler().flatten(mixed_graph(nodes))
+    unpickler = jsonpickle.unpickler.Unpickler()
+    return lambda: unpickler.restore(obj)
+
+
+@benchmark
+def restore_wide_iterative(nodes):
+    """Unpickler(iterative=True).restore() on the same graph"""
+    obj = jsonpickle.pickler.Pickler().flatten(mixed_graph(nodes))
+    unpickler = jsonpickle.unpickler.Unpickler(iterative=True)
+    return lambda: unpickler.restore(obj)
+
+
+@benchmark
+def restore_deep_iterative(nodes):
+    """Unpickler(iterative=True).restore() on deeply nested containers"""
+    obj = deep_graph(nodes)
+    unpickler = jsonpickle.unpickler.Unpickler(iterative=True)
+    return lambda: unpickler.restore(obj)
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options] [name ...]')
+    parser.add_option('-n', '--nodes', type='int', default=1000000,
+                      help='approximate number of values in each graph')
+    parser.add_option('-r', '--repeat', type='int', default=3,
+                      help='number of timed runs for each benchmark')
+    options, names = parser.parse_args()
+
+    for func in BENCHMARKS:
+        if names and func.__name__ not in names:
+            continue
+        timer = timeit.Timer(func(options.nodes))
+        best = min(timer.repeat(repeat=options.repeat, number=1))
+        print('%-24s %10.4f sec  %s' % (func.__name__, best, func.__doc__))
 
-pickled = jsonpickle.encode(doc)
-unpickled = jsonpickle.decode(pickled)
-if doc['feed']['title'] != unpickled['feed']['title']:
-    print 'Not a match'
-""" % mod
 
-print 'Using %s' % mod
-json_test = timeit.Timer(stmt=json)
-print "%.9f sec/pass " % (json_test.timeit(number=number) / number)
+if __name__ == '__main__':
+    main()
@@ -7,6 +7,9 @@
 # you should have received as part of this distribution.
 
 import doctest
+import os
+import subprocess
+import sys
 import unittest
 
 import jsonpickle
@@ -113,6 +116,59 @@ class HandlerTestCase(unittest.TestCase):
         self.assertTrue(self.roundtrip(a).creator is OtherHandler)
         self.assertTrue(self.roundtrip(b).creator is SpecializedHandler)
 
+    def test_base_handler_nearest_in_mro(self):
+        registry = jsonpickle.handlers.Registry()
+        OtherHandler = type('OtherHandler', (NullHandler,), {})
+        registry.register(CustomObject, NullHandler, base=True)
+        self.assertTrue(registry.get(CustomB) is NullHandler)
+
+        # the negative and positive results are cached until a change
+        registry.register(CustomA, OtherHandler, base=True)
+        self.assertTrue(registry.get(CustomB) is OtherHandler)
+        self.assertTrue(registry.get(CustomObject) is NullHandler)
+        self.assertTrue(registry.get(DecoratedChild) is NullHandler)
+
+        registry.unregister(CustomA)
+        self.assertTrue(registry.get(CustomB) is NullHandler)
+        registry.unregister(CustomObject)
+        self.assertTrue(registry.get(CustomB) is None)
+
+    def test_get_falls_back_to_name(self):
+        registry = jsonpickle.handlers.Registry()
+        self.assertTrue(registry.get(CustomA) is None)
+        registry.register_name('handler_test.CustomA', NullHandler)
+        self.assertTrue(registry.get(CustomA) is NullHandler)
+        self.assertTrue(registry.get('handler_test.CustomA') is NullHandler)
+        self.assertTrue(registry.get(CustomB, 'default') == 'default')
+
+    def test_register_clears_pickler_caches(self):
+        jsonpickle.encode(CustomA('a'))
+        self.assertTrue(CustomA in jsonpickle.pickler._flatteners)
+
+        jsonpickle.handlers.register(CustomA, NullHandler)
+        self.assertFalse(CustomA in jsonpickle.pickler._flatteners)
+
+        jsonpickle.encode(CustomA('a'))
+        jsonpickle.handlers.unregister(CustomA)
+        self.assertFalse(CustomA in jsonpickle.pickler._flatteners)
+
+    def test_clear_caches_clears_unpickler_caches(self):
+        self.assertTrue(jsonpickle.unpickler._has_plain_dict(CustomB))
+        self.assertTrue(CustomB in jsonpickle.unpickler._plain_classes)
+
+        jsonpickle.handlers.registry.clear_caches()
+        self.assertFalse(CustomB in jsonpickle.unpickler._plain_classes)
+
+    def test_store_drops_values_computed_before_a_change(self):
+        registry = jsonpickle.handlers.Registry()
+        cache = registry.add_cache({})
+        generation = registry.generation
+        registry.register(CustomA, NullHandler)
+        registry.store(cache, CustomA, 'stale', generation)
+        self.assertFalse(CustomA in cache)
+        registry.store(cache, CustomA, 'fresh', registry.generation)
+        self.assertEqual(cache[CustomA], 'fresh')
+
     def test_decorated_register(self):
         db = DecoratedBase('db')
         dc = DecoratedChild('dc')
@@ -120,6 +176,29 @@ class HandlerTestCase(unittest.TestCase):
         self.assertTrue(self.roundtrip(db).creator is DecoratedHandler)
         self.assertTrue(self.roundtrip(dc).creator is DecoratedHandler)
 
+    def test_register_name(self):
+        jsonpickle.handlers.registry.register_name('handler_test.CustomA',
+                                                   NullHandler)
+        try:
+            self.assertTrue(self.roundtrip(CustomA('a')).creator
+                            is NullHandler)
+        finally:
+            jsonpickle.handlers.unregister(CustomA)
+
+    def test_import_does_not_import_handled_modules(self):
+        """Ensure that the built-in handlers do not slow down imports"""
+        modules = ['datetime', 'decimal']
+        if sys.version_info >= (3, 7):
+            modules.append('queue')
+        code = ('import sys, jsonpickle; '
+                'print(" ".join(m for m in %r if m in sys.modules))' % modules)
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.path.dirname(
+            os.path.dirname(os.path.abspath(jsonpickle.__file__)))
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         env=env)
+        self.assertEqual(b'', output.strip())
+
 
 def suite():
     suite = unittest.TestSuite()
@@ -9,8 +9,12 @@
 
 import doctest
 import os
+import sys
+import tempfile
+import threading
 import unittest
 import collections
+import datetime
 
 import jsonpickle
 import jsonpickle.backend
@@ -19,7 +23,7 @@ import jsonpickle.handlers
 from jsonpickle import tags, util
 from jsonpickle.compat import unicode
 from jsonpickle.compat import unichr
-from jsonpickle.compat import PY32, PY3
+from jsonpickle.compat import PY32, PY3, ORDERED_DICTS
 
 
 class Thing(object):
@@ -75,6 +79,17 @@ class ThingWithProps(object):
         return self.identity == other.identity
 
 
+class SetAttrThing(object):
+
+    def __getstate__(self):
+        return dict((k, v) for k, v in self.__dict__.items()
+                    if k != 'assigned')
+
+    def __setattr__(self, name, value):
+        self.__dict__.setdefault('assigned', []).append(name)
+        object.__setattr__(self, name, value)
+
+
 class PicklingTestCase(unittest.TestCase):
 
     def setUp(self):
@@ -249,6 +264,94 @@ class PicklingTestCase(unittest.TestCase):
         self.assertEqual(cloned.child,
                          cloned.child.twin)
 
+    def test_functions_sharing_a_type(self):
+        # module-level functions and lambdas share the same type,
+        # but only module-level functions can be referenced by name
+        flattened = self.pickler.flatten([util.is_type, lambda: None])
+        self.assertEqual(flattened,
+                         [{tags.FUNCTION: 'jsonpickle.util.is_type'}, None])
+
+    def test_iterative_flatten_matches_recursive(self):
+        shared = [1, 2]
+        thing = Thing('parent')
+        thing.child = Thing('child')
+        obj = {'things': [thing, thing.child, (shared, set([3]))],
+               'shared': shared, 'deep': [[[{'k': shared}]]], 1: None}
+        thing.child.child = thing
+        iterative = jsonpickle.pickler.Pickler(iterative=True)
+        self.assertEqual(self.pickler.flatten(obj), iterative.flatten(obj))
+
+        # break the cycle, which cannot be flattened without references
+        thing.child.child = None
+        for kwargs in ({'unpicklable': False}, {'make_refs': False},
+                       {'keys': True}, {'max_depth': 3}):
+            recursive = jsonpickle.pickler.Pickler(**kwargs)
+            iterative = jsonpickle.pickler.Pickler(iterative=True, **kwargs)
+            self.assertEqual(recursive.flatten([obj, obj]),
+                             iterative.flatten([obj, obj]))
+
+    def test_iterative_flatten_deep_nesting(self):
+        depth = sys.getrecursionlimit() * 10
+        obj = [1]
+        for i in range(depth):
+            obj = [obj]
+        pickler = jsonpickle.pickler.Pickler(iterative=True)
+        flattened = pickler.flatten(obj)
+        for i in range(depth):
+            flattened = flattened[0]
+        self.assertEqual(flattened, [1])
+
+    def test_iterative_flatten_unbroken_cycle(self):
+        obj = {}
+        obj['self'] = obj
+        pickler = jsonpickle.pickler.Pickler(iterative=True)
+        self.assertRaises(ValueError, pickler.flatten, obj)
+
+    def test_iterative_flatten_cycle_through_dict(self):
+        thing = Thing('thing')
+        obj = {'k': thing}
+        thing.child = obj
+        for kwargs in ({}, {'make_refs': False},
+                       {'make_refs': False, 'cycle_check': 'ancestors'}):
+            recursive = jsonpickle.pickler.Pickler(**kwargs)
+            iterative = jsonpickle.pickler.Pickler(iterative=True, **kwargs)
+            self.assertEqual(recursive.flatten(obj), iterative.flatten(obj))
+        pickler = jsonpickle.pickler.Pickler(unpicklable=False,
+                                             iterative=True)
+        self.assertRaises(ValueError, pickler.flatten, obj)
+
+    def test_iterative_restore_matches_recursive(self):
+        shared = [1, 2]
+        thing = Thing('parent')
+        thing.child = Thing('child')
+        thing.child.child = thing
+        obj = {'things': [thing, thing.child, (shared, set([3]))],
+               'shared': shared, 'deep': [[[{'k': shared}]]], 1: None}
+        for keys in (False, True):
+            flattened = jsonpickle.pickler.Pickler(keys=keys).flatten(obj)
+            recursive = jsonpickle.unpickler.Unpickler(keys=keys)
+            iterative = jsonpickle.unpickler.Unpickler(keys=keys,
+                                                       iterative=True)
+            expect = recursive.restore(flattened)
+            actual = iterative.restore(flattened)
+            self.assertEqual(self.pickler.flatten(expect),
+                             self.pickler.flatten(actual))
+            things = actual['things']
+            self.assertTrue(things[0].child is things[1])
+            self.assertTrue(things[1].child is things[0])
+            self.assertTrue(things[2][0] is actual['shared'])
+
+    def test_iterative_restore_deep_nesting(self):
+        depth = sys.getrecursionlimit() * 10
+        flattened = [1]
+        for i in range(depth):
+            flattened = {'k': [flattened]}
+        unpickler = jsonpickle.unpickler.Unpickler(iterative=True)
+        obj = unpickler.restore(flattened)
+        for i in range(depth):
+            obj = obj['k'][0]
+        self.assertEqual(obj, [1])
+
     def test_tuple_notunpicklable(self):
         self.pickler.unpicklable = False
 
@@ -280,6 +383,19 @@ class PicklingTestCase(unittest.TestCase):
         inflated = self.unpickler.restore(flattened)
         self.assertEqual(inflated.themodule, None)
 
+    def test_class_plans_are_cached(self):
+        self.pickler.flatten([Thing('one'), Thing('two')])
+        self.assertTrue(Thing in jsonpickle.pickler._plans)
+        # modules can define protocol methods as globals
+        jsonpickle.pickler._get_plan(os)
+        self.assertFalse(type(os) in jsonpickle.pickler._plans)
+
+    def test_class_plans_honor_instance_overrides(self):
+        self.pickler.flatten(Thing('one'))
+        thing = Thing('two')
+        thing.__reduce__ = lambda: 'os.sep'
+        self.assertEqual(self.pickler.flatten(thing), os.sep)
+
     def test_thing_with_submodule(self):
         from distutils import sysconfig
 
@@ -398,6 +514,418 @@ class JSONPickleTestCase(unittest.TestCase):
         self.assertEqual(self.obj.name, actual.name)
         self.assertEqual(type(self.obj), type(actual))
 
+    def test_decode_single_pass(self):
+        obj = {'things': [self.obj, (1, 2), set([3])], 'empty': {}}
+        pickle = jsonpickle.encode(obj)
+        actual = jsonpickle.decode(pickle, single_pass=True)
+        self.assertEqual(self.obj.name, actual['things'][0].name)
+        self.assertEqual(type(self.obj), type(actual['things'][0]))
+        self.assertEqual((1, 2), actual['things'][1])
+        self.assertEqual(set([3]), actual['things'][2])
+        self.assertEqual({}, actual['empty'])
+
+    def test_decode_single_pass_with_references(self):
+        self.obj.child = self.obj
+        pickle = jsonpickle.encode([self.obj, self.obj])
+        actual = jsonpickle.decode(pickle, single_pass=True)
+        self.assertTrue(actual[0] is actual[1])
+        self.assertTrue(actual[0].child is actual[0])
+
+    def test_decode_in_place(self):
+        shared = [self.obj]
+        obj = {'things': [self.obj, (1, 2)], 'shared': [shared, shared],
+               'plain': {'a': [1, 2]}}
+        pickle = jsonpickle.encode(obj)
+        actual = jsonpickle.decode(pickle, in_place=True)
+        self.assertEqual(self.obj.name, actual['things'][0].name)
+        self.assertEqual((1, 2), actual['things'][1])
+        self.assertTrue(actual['shared'][0] is actual['shared'][1])
+        self.assertTrue(actual['shared'][0][0] is actual['things'][0])
+        self.assertEqual({'a': [1, 2]}, actual['plain'])
+
+        unpickler = jsonpickle.unpickler.Unpickler(in_place=True)
+        flattened = {'a': [{tags.TUPLE: [1]}, 2]}
+        restored = unpickler.restore(flattened)
+        self.assertTrue(restored is flattened)
+        self.assertEqual({'a': [(1,), 2]}, restored)
+
+    def test_decode_class_cache(self):
+        cache = jsonpickle.unpickler.ClassCache()
+        pickle = jsonpickle.encode([Thing('a'), Thing('b')])
+        for i in range(2):
+            actual = jsonpickle.decode(pickle, class_cache=cache)
+            self.assertEqual('b', actual[1].name)
+        self.assertEqual(1, cache.misses)
+        self.assertEqual(3, cache.hits)
+
+        # classes are looked up again when their module changes
+        module = type(sys)('jsonpickle_test_classes')
+        module.Thing = Thing
+        sys.modules[module.__name__] = module
+        try:
+            name = 'jsonpickle_test_classes.Thing'
+            self.assertTrue(cache.load(name) is Thing)
+            module.Thing = ThingWithProps
+            self.assertTrue(cache.load(name) is ThingWithProps)
+        finally:
+            del sys.modules[module.__name__]
+        self.assertEqual(None, cache.load(name))
+
+        # names that could not be loaded are tried again, even when as
+        # many modules are loaded as before
+        name = 'jsonpickle_test_classes.Other'
+        placeholder = 'jsonpickle_test_placeholder'
+        sys.modules[placeholder] = type(sys)(placeholder)
+        try:
+            self.assertEqual(None, cache.load(name))
+        finally:
+            del sys.modules[placeholder]
+        module.Other = Thing
+        sys.modules[module.__name__] = module
+        try:
+            self.assertTrue(cache.load(name) is Thing)
+        finally:
+            del sys.modules[module.__name__]
+
+    def test_decode_named_references(self):
+        pickle = ('{"a": {"py/object": "jsonpickle_test.Thing",'
+                  ' "name": "x", "child": null},'
+                  ' "b": {"py/ref": "/a"}, "c": [{"py/ref": "/a"}]}')
+        for kwargs in ({}, {'iterative': True}, {'in_place': True}):
+            actual = jsonpickle.decode(pickle, **kwargs)
+            self.assertTrue(actual['a'] is actual['b'])
+            self.assertTrue(actual['a'] is actual['c'][0])
+
+            # restore() finds the references without a pre-scan
+            unpickler = jsonpickle.unpickler.Unpickler(**kwargs)
+            actual = unpickler.restore(jsonpickle.json.decode(pickle))
+            self.assertEqual('x', actual['a'].name)
+            self.assertTrue(actual['a'] is actual['b'])
+            self.assertTrue(actual['a'] is actual['c'][0])
+
+        unpickler = jsonpickle.unpickler.Unpickler()
+        unpickler.restore(jsonpickle.json.decode(jsonpickle.encode(self.obj)))
+        self.assertEqual({}, unpickler._namedict)
+
+    def test_restore_named_references_again_with_factory(self):
+        pickle = ('{"a": {"py/object": "collections.defaultdict",'
+                  ' "default_factory": {"py/type": "__builtin__.list"},'
+                  ' "x": [1]}, "b": {"py/ref": "/a"}}')
+        for kwargs in ({}, {'iterative': True}):
+            # The first attempt meets the "py/ref" after restoring "a"
+            unpickler = jsonpickle.unpickler.Unpickler(sort_keys=True,
+                                                       **kwargs)
+            actual = unpickler.restore(jsonpickle.json.decode(pickle))
+            self.assertTrue(actual['a'] is actual['b'])
+            self.assertEqual(list, actual['a'].default_factory)
+            self.assertEqual({'x': [1]}, dict(actual['a']))
+
+    def test_decode_tracks_referenced_objects(self):
+        shared = Thing('shared')
+        pickle = jsonpickle.encode([Thing('a'), [shared], shared, [1]])
+        for iterative in (False, True):
+            unpickler = jsonpickle.unpickler.Unpickler(iterative=iterative)
+            actual = jsonpickle.unpickler.decode(pickle, context=unpickler)
+            self.assertEqual('shared', actual[2].name)
+            self.assertTrue(actual[1][0] is actual[2])
+            self.assertEqual([1], actual[3])
+            self.assertEqual([3], list(unpickler._objs))
+
+    def test_restore_objects_without_proxies(self):
+        a = Thing('a')
+        b = Thing('b')
+        a.child = b
+        b.child = a
+        flattened = jsonpickle.pickler.Pickler().flatten([a, [b, a]])
+        unpickler = jsonpickle.unpickler.Unpickler()
+        actual = unpickler.restore(flattened)
+        self.assertTrue(actual[0].child.child is actual[0])
+        self.assertTrue(actual[1][0] is actual[0].child)
+        self.assertTrue(actual[1][1] is actual[0])
+        self.assertFalse(unpickler._proxied)
+        self.assertEqual([], unpickler._proxies)
+
+    def test_restore_attributes_into_dict(self):
+        self.assertTrue(jsonpickle.unpickler._has_plain_dict(Thing))
+        self.assertFalse(jsonpickle.unpickler._has_plain_dict(SetAttrThing))
+
+        obj = SetAttrThing()
+        obj.__dict__.update({'a': 1, 'b': [Thing('b')]})
+        actual = jsonpickle.decode(jsonpickle.encode(obj))
+        self.assertEqual(['a', 'b'], actual.assigned)
+        self.assertEqual('b', actual.b[0].name)
+
+        # attribute names are native strings, as setattr() stores them
+        pickle = jsonpickle.encode(Thing('thing'))
+        for kwargs in ({}, {'iterative': True}):
+            actual = jsonpickle.decode(pickle, **kwargs)
+            self.assertEqual([str, str],
+                             [type(k) for k in actual.__dict__])
+
+    def test_encode_key_order(self):
+        shared = Thing('shared')
+        obj = {'b': [shared], 'a': shared}
+
+        pickle = jsonpickle.encode(obj, key_order='insertion')
+        if ORDERED_DICTS:
+            self.assertTrue(pickle.index('"b"') < pickle.index('"a"'))
+        else:
+            # dicts without an insertion order are flattened as by default
+            self.assertEqual(jsonpickle.encode(obj), pickle)
+        self.assertEqual(pickle,
+                         ''.join(jsonpickle.iterencode(obj,
+                                                       key_order='insertion')))
+        actual = jsonpickle.decode(pickle)
+        if ORDERED_DICTS:
+            self.assertEqual(['b', 'a'], list(actual.keys()))
+        self.assertTrue(actual['a'] is actual['b'][0])
+
+        # the backend must not sort the keys of insertion ordered dicts
+        jsonpickle.set_encoder_options('json', sort_keys=True)
+        try:
+            a, b = Thing('a'), Thing('b')
+            pickle = jsonpickle.encode({'z': [a, b], 'a': [b, a]},
+                                       key_order='insertion')
+        finally:
+            jsonpickle.set_encoder_options('json', sort_keys=False)
+        actual = jsonpickle.decode(pickle)
+        self.assertTrue(actual['z'][0] is actual['a'][1])
+        self.assertTrue(actual['z'][1] is actual['a'][0])
+
+        pickle = jsonpickle.encode(obj)
+        self.assertTrue(pickle.index('"a"') < pickle.index('"b"'))
+        actual = jsonpickle.decode(pickle)
+        self.assertTrue(actual['a'] is actual['b'][0])
+
+        obj = [shared, collections.defaultdict(list, {'b': 1, 'a': 2})]
+        pickle = jsonpickle.encode(obj, key_order='canonical')
+        self.assertEqual(pickle,
+                         ''.join(jsonpickle.iterencode(obj,
+                                                       key_order='canonical')))
+        objects = []
+        decoder = jsonpickle.json.json_decoder(
+            lambda pairs: objects.append([k for k, v in pairs]))
+        decoder.decode(pickle)
+        self.assertTrue(objects)
+        for keys in objects:
+            self.assertEqual(sorted(keys), keys)
+
+        # the items are flattened in the order the backend writes them in
+        obj = {'b': [shared], 10: [shared], None: [shared]}
+        pickle = jsonpickle.encode(obj, keys=True, key_order='canonical')
+        actual = jsonpickle.decode(pickle, keys=True)
+        self.assertTrue(actual['b'][0] is actual[10][0])
+        self.assertTrue(actual['b'][0] is actual[None][0])
+        obj = {10: [shared], (1,): [shared]}
+        pickle = jsonpickle.encode(obj, keys=True, key_order='canonical')
+        actual = jsonpickle.decode(pickle, keys=True)
+        self.assertTrue(actual[10][0] is actual[(1,)][0])
+
+        self.assertRaises(ValueError, jsonpickle.encode, obj,
+                          key_order='random')
+
+    def test_encode_default_order(self):
+        # The backend writes the dicts that flatten() returns, which hold
+        # their items in sorted order, in the order of those dicts
+        shared = [1]
+        thing = SetAttrThing()
+        thing.b = shared
+        thing.a = {'y': 2, 'x': shared}
+        obj = {'things': [thing], 'c': shared, 'a': (1,)}
+        state = {'a': {'x': {tags.ID: 0}, 'y': 2}, 'b': {tags.ID: 0}}
+        expect = jsonpickle.json.encode({
+            'a': {tags.TUPLE: [1]},
+            'c': [1],
+            'things': [{tags.OBJECT: 'jsonpickle_test.SetAttrThing',
+                        tags.STATE: state}],
+        })
+        self.assertEqual(expect, jsonpickle.encode(obj))
+        self.assertEqual(expect, ''.join(jsonpickle.iterencode(obj)))
+        self.assertEqual(expect, jsonpickle.encode(obj, iterative=True))
+
+    def test_decode_document_order(self):
+        shared = Thing('shared')
+        obj = {'b': [shared], 2: shared, 10: shared, (1,): shared}
+        pickle = jsonpickle.encode(obj, keys=True)
+        actual = jsonpickle.decode(pickle, keys=True)
+        self.assertEqual('shared', actual[(1,)].name)
+        self.assertTrue(actual[2] is actual[(1,)])
+        self.assertTrue(actual[10] is actual[(1,)])
+        self.assertTrue(actual['b'][0] is actual[(1,)])
+
+        if ORDERED_DICTS:
+            pickle = '{"b": 1, "a": 2}'
+            self.assertEqual(['b', 'a'], list(jsonpickle.decode(pickle)))
+            self.assertEqual(['a', 'b'],
+                             list(jsonpickle.decode(pickle, sort_keys=True)))
+        else:
+            # the parsed dicts have no document order to follow
+            self.assertTrue(jsonpickle.unpickler.Unpickler().sort_keys)
+
+    def test_encode_plain_containers(self):
+        obj = {'b': [1, 2.5, None], 'a': (True, 'x'), 'c': set([3])}
+        self.assertEqual({'a': {tags.TUPLE: [True, 'x']},
+                          'b': [1, 2.5, None],
+                          'c': {tags.SET: [3]}},
+                         jsonpickle.pickler.Pickler().flatten(obj))
+        pickle = jsonpickle.encode(obj, unpicklable=False)
+        self.assertEqual(jsonpickle.json.encode({'a': [True, 'x'],
+                                                 'b': [1, 2.5, None],
+                                                 'c': [3]}),
+                         pickle)
+        self.assertEqual(pickle, jsonpickle.encode(obj, unpicklable=False,
+                                                   iterative=True))
+
+        # Plain documents are written in the same order as the others
+        obj = {'b': 1, 'a': 2, 'c': 3}
+        for key_order in jsonpickle.pickler.KEY_ORDERS:
+            plain = jsonpickle.encode([obj], unpicklable=False,
+                                      key_order=key_order)
+            other = jsonpickle.encode([obj, set()], unpicklable=False,
+                                      key_order=key_order)
+            self.assertEqual(plain[:-1] + ', []]', other)
+
+        # The items of a plain list still honor max_depth
+        self.assertEqual(['1', '2'],
+                         jsonpickle.pickler.Pickler(max_depth=1).flatten([1, 2]))
+
+        shared = [1, 2]
+        pickle = jsonpickle.encode([shared, shared], make_refs=False,
+                                   unpicklable=False)
+        self.assertEqual('[[1, 2], "[1, 2]"]', pickle)
+        # Reserved keys are still left out
+        self.assertEqual('{"a": 1}',
+                         jsonpickle.encode({'a': 1, tags.ID: 1},
+                                           unpicklable=False))
+
+    def test_flatten_json_engine(self):
+        shared = Thing('shared')
+        shared.child = {'tags': [1, 2], 'pair': (1, 'x'), 'set': set([3])}
+        obj = [shared, {'a': shared, 10: [shared]}, datetime.date(2015, 1, 2),
+               collections.defaultdict(list, {'b': [1]})]
+
+        pickler = jsonpickle.pickler.Pickler(unpicklable=False)
+        flattened = pickler.flatten(obj)
+        self.assertTrue(pickler._json_only)
+        self.assertEqual({}, pickler._objs)
+        iterative = jsonpickle.pickler.Pickler(unpicklable=False,
+                                               iterative=True)
+        self.assertEqual(iterative.flatten(obj), flattened)
+        self.assertEqual({'child': {'tags': [1, 2], 'pair': [1, 'x'],
+                                    'set': [3]},
+                          'name': 'shared'},
+                         flattened[0])
+        self.assertEqual(flattened[0], flattened[1]['a'])
+
+        obj.append(obj)
+        self.assertRaises(ValueError, pickler.flatten, obj)
+        self.assertRaises(ValueError, jsonpickle.encode, obj,
+                          unpicklable=False)
+
+        # The error does not leave the objects behind as ancestors
+        obj.pop()
+        self.assertEqual(flattened, pickler.flatten(obj, reset=False))
+
+    def test_flatten_only_keeps_referenced_objects_alive(self):
+        try:
+            import tracemalloc
+        except ImportError:
+            return self.skipTest('no tracemalloc before python 3.4')
+        # The [] keeps the list from being copied as a plain list
+        obj = [i * 0.5 for i in range(100000)] + [[]]
+        pickler = jsonpickle.pickler.Pickler()
+        tracemalloc.start()
+        try:
+            flattened = pickler.flatten(obj)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(obj, flattened)
+        # Pinning every float would double the memory used by the result
+        self.assertTrue(peak < 1.5 * sys.getsizeof(flattened))
+
+    def test_dump_and_load(self):
+        shared = Thing('shared')
+        obj = {'things': [shared, shared], 'numbers': list(range(5000))}
+        fp = tempfile.TemporaryFile('w+')
+        try:
+            jsonpickle.dump(obj, fp)
+            fp.seek(0)
+            self.assertEqual(jsonpickle.encode(obj), fp.read())
+            fp.seek(0)
+            actual = jsonpickle.load(fp)
+        finally:
+            fp.close()
+        self.assertEqual(obj['numbers'], actual['numbers'])
+        self.assertEqual('shared', actual['things'][0].name)
+        self.assertTrue(actual['things'][0] is actual['things'][1])
+
+    def test_dump_and_load_cycle_through_dict(self):
+        thing = Thing('thing')
+        obj = {'k': thing}
+        thing.child = obj
+        fp = tempfile.TemporaryFile('w+')
+        try:
+            jsonpickle.dump(obj, fp)
+            fp.seek(0)
+            self.assertEqual(jsonpickle.encode(obj), fp.read())
+            fp.seek(0)
+            actual = jsonpickle.load(fp)
+        finally:
+            fp.close()
+        self.assertEqual('thing', actual['k'].name)
+        self.assertTrue(actual['k'].child['k'] is actual['k'])
+
+    def test_dump_and_iter_load_lines(self):
+        shared = Thing('shared')
+        records = [[shared, shared], {'a': 1}, 'line\nbreak', [shared]]
+        records.extend(range(3000))
+        fp = tempfile.TemporaryFile('w+')
+        try:
+            jsonpickle.dump_lines(records, fp)
+            fp.write('\n')
+            fp.seek(0)
+            lines = fp.readlines()
+            fp.seek(0)
+            actual = list(jsonpickle.iter_load_lines(fp))
+        finally:
+            fp.close()
+        self.assertEqual(len(records) + 1, len(lines))
+        self.assertEqual(jsonpickle.encode(records[0]) + '\n', lines[0])
+        # References are reset between records
+        self.assertEqual(jsonpickle.encode(records[3]) + '\n', lines[3])
+        self.assertEqual(len(records), len(actual))
+        self.assertTrue(actual[0][0] is actual[0][1])
+        self.assertEqual('shared', actual[3][0].name)
+        self.assertEqual('line\nbreak', actual[2])
+        self.assertEqual(records[4:], actual[4:])
+
+    def test_decode_classes(self):
+        pickle = jsonpickle.encode([Thing('a'), ThingWithProps, Thing])
+        names = {'jsonpickle_test.ThingWithProps': Thing}
+        actual = jsonpickle.decode(pickle, classes=names)
+        self.assertEqual('a', actual[0].name)
+        self.assertTrue(actual[1] is Thing)
+        self.assertTrue(actual[2] is Thing)
+
+        actual = jsonpickle.decode(pickle, classes=[Thing],
+                                   import_classes=False)
+        self.assertEqual('a', actual[0].name)
+        self.assertEqual({tags.TYPE: 'jsonpickle_test.ThingWithProps'},
+                         actual[1])
+        self.assertTrue(actual[2] is Thing)
+
+        pickle = jsonpickle.encode(datetime.date(2015, 1, 2))
+        actual = jsonpickle.decode(pickle, import_classes=False)
+        self.assertEqual('datetime.date', actual[tags.OBJECT])
+
+        pickle = '{"py/repr": "os/os.getpid()"}'
+        actual = jsonpickle.decode(pickle, classes=[], import_classes=False)
+        self.assertEqual({tags.REPR: 'os/os.getpid()'}, actual)
+        actual = jsonpickle.decode(pickle, classes=[], import_classes=False,
+                                   iterative=True)
+        self.assertEqual({tags.REPR: 'os/os.getpid()'}, actual)
+
     def test_json(self):
         expect = self.obj
         pickle = jsonpickle.encode(self.obj)
@@ -574,6 +1102,45 @@ class JSONPickleTestCase(unittest.TestCase):
         self.assertEqual(slash_hello, '/hello')
         self.assertEqual(world, 'world')
 
+    def test_backends_are_imported_on_first_use(self):
+        backend = jsonpickle.backend.JSONBackend()
+        self.assertEqual({}, backend._encoders)
+        self.assertEqual('[1]', backend.encode([1]))
+        self.assertTrue(backend._backend_names[0] in backend._encoders)
+        self.assertFalse('ujson' in backend._encoders)
+
+    def test_backends_are_imported_once_across_threads(self):
+        errors = []
+
+        def use_every_backend(backend, start):
+            start.wait()
+            try:
+                for name in list(backend._backend_names):
+                    if backend._import(name):
+                        backend.backend_encode(name, [1])
+                        backend._decoder_exceptions[name]
+            except Exception as e:
+                errors.append(e)
+
+        for i in range(20):
+            backend = jsonpickle.backend.JSONBackend()
+            start = threading.Event()
+            threads = [threading.Thread(target=use_every_backend,
+                                        args=(backend, start))
+                       for j in range(4)]
+            for thread in threads:
+                thread.start()
+            start.set()
+            for thread in threads:
+                thread.join()
+        self.assertEqual([], errors)
+
+    def test_default_backend_is_shared(self):
+        self.assertTrue(jsonpickle.pickler.Pickler().backend is
+                        jsonpickle.json)
+        self.assertTrue(jsonpickle.unpickler.Unpickler().backend is
+                        jsonpickle.json)
+
     def test_load_backend_submodule(self):
         """Test that we can load a submodule as a backend
 
@@ -667,6 +1234,62 @@ class JSONPickleTestCase(unittest.TestCase):
         self.assertEqual(decoded.a[1][0:3], '[1,')
         self.assertEqual(decoded.a[2][0][0:3], '[1,')
 
+    def test_make_refs_disabled_ancestors(self):
+        thing = Thing('parent')
+        thing.a = [1]
+        thing.b = thing.a
+        thing.child = thing
+        thing.d = {}
+        thing.d['self'] = thing.d
+
+        for iterative in (False, True):
+            encoded = jsonpickle.encode(thing, make_refs=False,
+                                        cycle_check='ancestors',
+                                        iterative=iterative)
+            decoded = jsonpickle.decode(encoded)
+            # Shared objects are written in full, and only cycles are cut
+            self.assertEqual([1], decoded.a)
+            self.assertEqual([1], decoded.b)
+            self.assertTrue(decoded.a is not decoded.b)
+            self.assertEqual(repr(thing), decoded.child)
+            self.assertEqual(repr(thing.d), decoded.d['self'])
+
+        pickler = jsonpickle.pickler.Pickler(make_refs=False,
+                                             cycle_check='ancestors')
+        pickler.flatten([thing], reset=False)
+        self.assertEqual({}, pickler._objs)
+        self.assertEqual(set(), pickler._ancestors)
+        self.assertRaises(ValueError, jsonpickle.encode, thing,
+                          cycle_check='parents')
+
+    def test_make_refs_disabled_ancestors_after_errors(self):
+        class Broken(object):
+            def __getstate__(self):
+                raise RuntimeError('broken')
+
+        shared = Thing('shared')
+        for iterative in (False, True):
+            pickler = jsonpickle.pickler.Pickler(make_refs=False,
+                                                 cycle_check='ancestors',
+                                                 iterative=iterative)
+            shared.child = Broken()
+            self.assertRaises(RuntimeError, pickler.flatten, [shared])
+            self.assertEqual(set(), pickler._ancestors)
+            shared.child = None
+            flattened = pickler.flatten([shared, shared], reset=False)
+            # the second one is not mistaken for a cycle and its repr()
+            self.assertTrue(isinstance(flattened[1], dict))
+            self.assertEqual(flattened[0], flattened[1])
+
+        # iterencode() can be abandoned halfway through
+        pickler = jsonpickle.pickler.Pickler(make_refs=False,
+                                             cycle_check='ancestors')
+        chunks = pickler.iterencode([Thing('a') for i in range(2000)])
+        next(chunks)
+        self.assertNotEqual(set(), pickler._ancestors)
+        chunks.close()
+        self.assertEqual(set(), pickler._ancestors)
+
 
 class PicklableNamedTuple(object):
     """